@@ -0,0 +1,1236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ЗАМЕРЫ ПРОИЗВОДИТЕЛЬНОСТИ ГЕНЕРАТОРА ФОРМ
+Запуск: python benchmarks.py suite --json results.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+from form_generator import (BB_TAG_RE, EXPORT_FORMATS, FIELD_CLASSIFIER, FIELD_KEYWORDS, HASH_ALGORITHMS, INLINE_TAGS,
+                            FormHistory, HashIndex, ImprovedFormGenerator, ParseCache, hash_text,
+                            minify_bbcode, render_formats, split_bbcode, utf8_length)
+
+# Вопросы-образцы для синтетических форм (по одному на каждый тип поля)
+SAMPLE_QUESTIONS = [
+    ("Ваш игровой Никнейм", "text", "Ivan_Petrov"),
+    ("Ваш игровой уровень", "text", "42"),
+    ("Скриншот статистики аккаунта(/time)", "screenshot", "https://imgur.com/a/abc123"),
+    ("Как вы считаете, почему именно вы должны занять пост старшего состава", "multiline",
+     "Я давно играю на сервере\nЗнаю правила\nГотов помогать новичкам"),
+    ("Ссылка на страницу ВК", "link", "https://vk.com/id1"),
+    ("Логин Discord", "text", "ivan#1234"),
+    ("Ваш часовой пояс", "text", "MSK"),
+    ("Ваш реальный возраст", "text", "19"),
+]
+
+
+def make_filled_questions(count, seed=0):
+    """Синтетическая заполненная форма из count вопросов"""
+    rng = random.Random(seed)
+    filled_questions = []
+    for number in range(1, count + 1):
+        question, field_type, answer = rng.choice(SAMPLE_QUESTIONS)
+        filled_questions.append({
+            "number": number,
+            "question": question,
+            "original": f"{number}. {question}:",
+            "answer": answer,
+            "type": field_type
+        })
+    return filled_questions
+
+
+def make_form_text(count, seed=0):
+    """Синтетический текст формы из count вопросов (как его вставляет пользователь)"""
+    rng = random.Random(seed)
+    lines = ["Форма подачи заявления:", ""]
+    for number in range(1, count + 1):
+        question = rng.choice(SAMPLE_QUESTIONS)[0]
+        lines.append(f"{number}. {question} (пункт {number}):")
+    return "\n".join(lines)
+
+
+def make_archive(folder, count, seed=0):
+    """Папка с count ранее сохраненными формами (пары .txt + .json)"""
+    generator = ImprovedFormGenerator()
+    design = generator.designs["1"]
+    filled_questions = make_filled_questions(12, seed)
+    bbcode = generator.generate_bbcode("Архив", filled_questions, design)
+
+    os.makedirs(folder, exist_ok=True)
+    for index in range(count):
+        name = f"archive_{index:06d}"
+        with open(os.path.join(folder, name + ".txt"), 'w', encoding='utf-8') as f:
+            f.write(bbcode)
+        with open(os.path.join(folder, name + ".json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                "title": "Архив",
+                "questions": filled_questions,
+                "design": design,
+                "bbcode": bbcode,
+                "bbcode_hash": f"{index:032x}",
+                "generated": "20240101_000000"
+            }, f, ensure_ascii=False, indent=2)
+
+
+def legacy_generate_bbcode(title, filled_questions, design):
+    """Генерация BB-кода в том виде, в каком она была до планов отрисовки (для сравнения)"""
+    rows = []
+
+    for q in filled_questions:
+        question_text = q["question"]
+        if not question_text.endswith(":"):
+            question_text = f"{question_text}:"
+
+        question_display = f"ВОПРОС {q['number']}. {question_text}"
+        answer = q["answer"]
+        field_type = q["type"]
+
+        if field_type == "screenshot":
+            if answer:
+                answer_bb = f'[color={design["link"]}][url={answer}]Скриншот[/url][/color]'
+            else:
+                answer_bb = f'[color={design["answer"]}](скриншот не загружен)[/color]'
+
+        elif field_type == "link":
+            if answer:
+                q_lower = q["question"].lower()
+                if "vk" in q_lower or "вк" in q_lower:
+                    display_text = "Профиль ВК"
+                elif "discord" in q_lower or "дискорд" in q_lower:
+                    display_text = "Discord"
+                elif "биограф" in q_lower:
+                    display_text = "Биография"
+                else:
+                    display_text = "Ссылка"
+
+                answer_bb = f'[color={design["link"]}][url={answer}]{display_text}[/url][/color]'
+            else:
+                answer_bb = f'[color={design["answer"]}](ссылка не указана)[/color]'
+
+        elif field_type == "multiline":
+            if answer:
+                formatted_lines = []
+                for line in answer.split('\n'):
+                    if line.strip():
+                        formatted_lines.append(f'[color={design["answer"]}]{line.strip()}[/color]')
+                answer_bb = '\n'.join(formatted_lines)
+            else:
+                answer_bb = f'[color={design["answer"]}](не заполнено)[/color]'
+
+        else:
+            answer_bb = f'[color={design["answer"]}]{answer}[/color]'
+
+        rows.append(f'[tr][td][color={design["question"]}][b]{question_display}[/b][/color][/td][td]{answer_bb}[/td][/tr]')
+
+    rows_text = "\n".join(rows)
+    return f"""[center][font=Courier New]
+[size=11][b][color={design["header"]}]┌────────────────────┐[/color]
+{title.upper()}
+[color={design["header"]}]└────────────────────┘[/color][/b][/size]
+
+[size=9]
+[table]
+{rows_text}
+[/table]
+[/size]
+[/font][/center]"""
+
+
+# Вопросы, на которых легко ошибиться: слова внутри других слов ("ник" в "никнейм",
+# "лет" в "летний", "вк" во "вконтакте"), регистр, английские слова и длинные вопросы
+GOLDEN_QUESTIONS = [
+    "Ваш игровой Никнейм", "Ваш ник", "НИК В ИГРЕ", "Логин Discord", "Nickname", "Your nick",
+    "Сколько вам лет?", "Ваш возраст", "Age", "Полных годиков", "Год рождения", "С какого года играете",
+    "Летний отпуск планируете?", "Уровень аккаунта", "LVL", "Level персонажа",
+    "Ваш часовой пояс", "Часовой", "Таймзона", "Timezone (UTC)", "Пояс",
+    "Ссылка на страницу ВК", "Вконтакте", "VK", "Дискорд", "Discord", "Ссылка на биографию",
+    "Биография персонажа", "Профиль на форуме", "URL сайта", "Сайт",
+    "Скриншот статистики аккаунта(/time)", "Screenshot", "/time", "Статистика",
+    "Почему именно вы?", "Расскажите о себе", "Обоснование", "Как вы считаете, справитесь ли вы",
+    "Как вы считаете, почему именно вы должны занять пост старшего состава",
+    "Ник и уровень", "Ссылка на скриншот", "Скриншот профиля ВК", "Возраст и часовой пояс",
+    "", "   ", "Имя", "Город", "Опыт администрирования на других проектах сервера BlackRussia",
+]
+
+GOLDEN_ANSWERS = ["", " ", "a", "ab", "Ivan_Petrov", "x" * 30, "13", "16", "19", "101", "50", "0",
+                  "сорок", "MSK", "GMT+3", "UTC-5", "Москва", "https://vk.com/id1", "vk.com/id1",
+                  "http://imgur.com/a", "Я давно играю\nЗнаю правила"]
+
+# Слова-наполнители для случайных вопросов
+FILLER_WORDS = ["ваш", "ваша", "на", "в", "игре", "сервере", "аккаунта", "персонажа", "и", "или",
+                "укажите", "пожалуйста", "полностью", "реальный", "форуме", "?", ":", "(", ")"]
+
+
+def legacy_categories(question):
+    """Категории вопроса по циклу any(слово in вопрос) для каждой группы (как до KeywordClassifier)"""
+    question_lower = question.lower()
+    return frozenset(category for category, words in FIELD_KEYWORDS.items()
+                     if any(word in question_lower for word in words))
+
+
+def legacy_detect_field_type(question):
+    """Определение типа поля в том виде, в каком оно было до KeywordClassifier (для сравнения)"""
+    question_lower = question.lower()
+
+    if any(word in question_lower for word in ["скриншот", "screenshot", "/time", "статистик", "статистики"]):
+        return "screenshot"
+
+    if any(word in question_lower for word in ["ссылка", "url", "сайт", "профиль", "биографи", "биография", "vk", "вк", "дискорд"]):
+        return "link"
+
+    if len(question) > 50 or any(word in question_lower for word in ["почему", "расскажите", "обоснование", "считаете"]):
+        return "multiline"
+
+    return "text"
+
+
+def legacy_validate_input(question_text, answer, field_type):
+    """Проверка ответа в том виде, в каком она была до KeywordClassifier (для сравнения)"""
+    question_lower = question_text.lower()
+
+    if any(word in question_lower for word in ["возраст", "лет", "годиков", "года", "годков", "age", "сколько лет"]):
+        try:
+            age = int(answer)
+            if age < 14 or age > 100:
+                return False, "⚠️  Возраст должен быть в диапазоне от 14 до 100 лет."
+            if age < 18:
+                return True, "⚠️  Внимание: вам меньше 18 лет. Убедитесь, что это правильно."
+        except ValueError:
+            return False, "⚠️  Возраст должен быть целым числом."
+
+    if any(word in question_lower for word in ["никнейм", "ник", "логин", "nickname", "nick"]):
+        if not answer.strip():
+            return False, "⚠️  Никнейм не может быть пустым."
+        if len(answer) > 25:
+            return False, "⚠️  Никнейм слишком длинный (максимум 25 символов)."
+        if len(answer) < 3:
+            return False, "⚠️  Никнейм слишком короткий (минимум 3 символа)."
+
+    if any(word in question_lower for word in ["уровень", "level", "lvl"]):
+        try:
+            level = int(answer)
+            if level < 1 or level > 100:
+                return False, "⚠️  Уровень должен быть в диапазоне от 1 до 100."
+        except ValueError:
+            return False, "⚠️  Уровень должен быть целым числом."
+
+    if any(word in question_lower for word in ["часовой пояс", "таймзона", "timezone", "часовой"]):
+        if not any(word in answer.lower() for word in ["gmt", "utc", "msk", "+", "-"]):
+            return True, "⚠️  Убедитесь, что правильно указали часовой пояс (например, GMT+3, UTC+5, MSK)."
+
+    if field_type == "link" or field_type == "screenshot":
+        if not answer.startswith(("http://", "https://")):
+            return False, "⚠️  Ссылка должна начинаться с http:// или https://"
+
+    if len(answer.strip()) < 2 and field_type == "text":
+        return True, "⚠️  Ответ очень короткий. Убедитесь, что это правильно."
+
+    return True, "✅ Ответ принят"
+
+
+def make_questions(count, seed=0):
+    """Случайные вопросы из ключевых слов всех групп, их кусков и слов-наполнителей"""
+    rng = random.Random(seed)
+    keywords = [word for words in FIELD_KEYWORDS.values() for word in words]
+    questions = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 8)):
+            word = rng.choice(keywords) if rng.random() < 0.4 else rng.choice(FILLER_WORDS)
+            if rng.random() < 0.2:
+                # Кусок слова или слово, приклеенное к соседнему
+                word = word[:rng.randint(1, len(word))]
+            if rng.random() < 0.3:
+                word = word.upper() if rng.random() < 0.5 else word.capitalize()
+            parts.append(word)
+        questions.append(("" if rng.random() < 0.2 else " ").join(parts))
+    return questions
+
+
+def bench_classify(args):
+    """Классификация вопросов: сверка с прежними циклами по ключевым словам и скорость"""
+    generator = ImprovedFormGenerator()
+    questions = GOLDEN_QUESTIONS + make_questions(args.questions, args.seed)
+    FIELD_CLASSIFIER.cache_clear()
+
+    mismatches = 0
+    for question in questions:
+        expected = {
+            "категории": legacy_categories(question),
+            "тип поля": legacy_detect_field_type(question)
+        }
+        actual = {
+            "категории": FIELD_CLASSIFIER.classify(question),
+            "тип поля": generator.detect_field_type(question)
+        }
+        field_type = expected["тип поля"]
+        for answer in GOLDEN_ANSWERS:
+            expected[f"ответ {answer!r}"] = legacy_validate_input(question, answer, field_type)
+            actual[f"ответ {answer!r}"] = generator.validate_input(question, answer, field_type)
+
+        for check, value in expected.items():
+            if actual[check] != value:
+                mismatches += 1
+                if mismatches <= 10:
+                    print(f"❌ {question!r}, {check}: было {value}, стало {actual[check]}")
+
+    print(f"📋 Вопросов: {len(questions)} (образцов: {len(GOLDEN_QUESTIONS)}), "
+          f"ответов на вопрос: {len(GOLDEN_ANSWERS)}")
+    if mismatches:
+        print(f"❌ Расхождений с прежней классификацией: {mismatches}")
+        return 1
+    print("✅ Категории, типы полей и проверки ответов совпадают с прежними")
+
+    def classify_all():
+        FIELD_CLASSIFIER.cache_clear()
+        for question in questions:
+            FIELD_CLASSIFIER.classify(question)
+
+    legacy = best_time(lambda: [legacy_categories(question) for question in questions], args.repeat)
+    compiled = best_time(classify_all, args.repeat)
+    print(f"  Циклы по ключевым словам: {legacy * 1000:.2f} мс")
+    print(f"  Одно регулярное выражение: {compiled * 1000:.2f} мс (x{legacy / compiled:.2f}, без кэша)")
+    return 0
+
+
+def best_time(func, repeat):
+    """Лучшее время одного вызова из repeat попыток (в секундах)"""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def bench_render(args):
+    """Отрисовка формы: старый generate_bbcode против плана отрисовки"""
+    generator = ImprovedFormGenerator()
+    filled_questions = make_filled_questions(args.rows)
+    title = "Форма подачи заявления"
+
+    print(f"📋 Строк в форме: {args.rows}, повторов: {args.repeat}")
+    for key, design in generator.designs.items():
+        if legacy_generate_bbcode(title, filled_questions, design) != generator.generate_bbcode(title, filled_questions, design):
+            print(f"❌ Результат для стиля {key} отличается от старого генератора!")
+            return 1
+
+        legacy = best_time(lambda: legacy_generate_bbcode(title, filled_questions, design), args.repeat)
+        planned = best_time(lambda: generator.generate_bbcode(title, filled_questions, design), args.repeat)
+        print(f"  [{key}] {design['name']}: было {legacy * 1000:.2f} мс, "
+              f"стало {planned * 1000:.2f} мс (x{legacy / planned:.2f})")
+    return 0
+
+
+def bench_rerender(args):
+    """Правка одного ответа: полная перерисовка с MD5 против перерисовки по строкам"""
+    generator = ImprovedFormGenerator()
+    design = generator.designs["1"]
+    title = "Форма подачи заявления"
+    filled_questions = make_filled_questions(args.rows)
+    counter = iter(range(10 ** 9))
+
+    def edit():
+        # Как в edit_answers: меняется ответ одного вопроса
+        q = filled_questions[args.rows // 2]
+        q["answer"] = f"Новый ответ {next(counter)}"
+
+    def full():
+        bbcode = generator.generate_bbcode(title, filled_questions, design)
+        return bbcode, generator.get_bbcode_hash(bbcode)
+
+    generator.render_form(title, filled_questions, design)
+    if generator.render_form(title, filled_questions, design)[0] != full()[0]:
+        print("❌ BB-код при перерисовке по строкам отличается!")
+        return 1
+
+    full_best = time_stage(full, args.repeat, edit)[0]
+    rows_best = time_stage(lambda: generator.render_form(title, filled_questions, design), args.repeat, edit)[0]
+    print(f"📋 Строк в форме: {args.rows}, правок: {args.repeat}")
+    print(f"  Полная перерисовка + MD5: {full_best * 1000:.2f} мс")
+    print(f"  Перерисовка по строкам:   {rows_best * 1000:.2f} мс (x{full_best / rows_best:.2f})")
+    return 0
+
+
+def bench_parallel(args):
+    """Отрисовка множества форм: один процесс против пула из 1..N процессов"""
+    generator = ImprovedFormGenerator()
+    designs = list(generator.designs.values())
+    forms = [(f"Заявление {index}", make_filled_questions(args.rows, seed=index), designs[index % len(designs)])
+             for index in range(args.forms)]
+    max_workers = args.max_workers or os.cpu_count() or 1
+
+    print(f"📋 Форм: {args.forms}, вопросов в форме: {args.rows}, ядер: {os.cpu_count()}")
+    started = time.perf_counter()
+    expected = generator.generate_bbcode_many(forms, workers=0)
+    serial = time.perf_counter() - started
+    print(f"  без пула     {serial * 1000:9.1f} мс")
+
+    for workers in range(1, max_workers + 1):
+        started = time.perf_counter()
+        result = generator.generate_bbcode_many(forms, workers=workers, chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - started
+        if result != expected:
+            print(f"❌ Результат пула из {workers} процессов отличается!")
+            return 1
+        print(f"  процессов {workers:<2} {elapsed * 1000:9.1f} мс (x{serial / elapsed:.2f})")
+    return 0
+
+
+def time_stage(func, repeat, setup=None):
+    """Лучшее и медианное время вызова func (setup выполняется перед каждым вызовом)"""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return min(times), statistics.median(times)
+
+
+def bench_suite(args):
+    """Все этапы по отдельности: разбор, классификация, проверка, отрисовка, хэш, сохранение"""
+    generator = ImprovedFormGenerator()
+    design = generator.designs["1"]
+    title = "Форма подачи заявления"
+    results = []
+
+    def record(stage, size, timing, unit):
+        best, median = timing
+        results.append({"stage": stage, "size": size, "unit": unit, "repeat": args.repeat,
+                        "best_s": best, "median_s": median})
+        print(f"  {stage:<15} {size:>7} {unit:<9} лучшее {best * 1000:9.3f} мс   медиана {median * 1000:9.3f} мс")
+
+    import tempfile
+    cache_folder = tempfile.TemporaryDirectory()
+    generator.parse_cache = ParseCache(cache_folder.name)
+
+    print(f"📋 Формы: {args.sizes}, архивы: {args.archives}, повторов: {args.repeat}")
+    for size in args.sizes:
+        form_text = make_form_text(size)
+        form_lines = form_text.split("\n")
+        questions = generator.parse_form_stream(form_lines)[1]
+        filled_questions = make_filled_questions(size)
+
+        # Разбор, классификация и проверка - с холодным кэшем классификатора
+        clear_cache = FIELD_CLASSIFIER.cache_clear
+
+        record("parse", size, time_stage(lambda: generator.parse_form_stream(form_lines), args.repeat, clear_cache), "вопросов")
+
+        # Повторная вставка того же шаблона - из кэша разобранных форм
+        generator.parse_full_form(form_text)
+        generator.parse_cache._memory.clear()
+        record("parse_hit", size, time_stage(
+            lambda: generator.parse_full_form(form_text), args.repeat, generator.parse_cache._memory.clear), "вопросов")
+        record("classify", size, time_stage(
+            lambda: [generator.detect_field_type(q["original"]) for q in questions], args.repeat, clear_cache), "вопросов")
+        record("validate", size, time_stage(
+            lambda: [generator.validate_input(q["question"], q["answer"], q["type"]) for q in filled_questions],
+            args.repeat, clear_cache), "ответов")
+        # Столбец ответов на один вопрос (например, возраст из всех заявок)
+        ages = [str(random.Random(size).randint(10, 110)) for _ in range(size)]
+        record("validate_column", size, time_stage(
+            lambda: generator.validate_column("Ваш реальный возраст", ages, "text"), args.repeat, clear_cache), "ответов")
+        record("render", size, time_stage(
+            lambda: generator.generate_bbcode(title, filled_questions, design), args.repeat), "вопросов")
+        bbcode = generator.generate_bbcode(title, filled_questions, design)
+        record("hash", size, time_stage(lambda: generator.get_bbcode_hash(bbcode), args.repeat), "вопросов")
+
+    cache_folder.cleanup()
+
+    filled_questions = make_filled_questions(12)
+    for archive_size in args.archives:
+        with tempfile.TemporaryDirectory() as folder:
+            make_archive(folder, archive_size)
+            generator.output_folder = folder
+            generator.hash_index = HashIndex(folder)
+
+            record("index", archive_size, time_stage(generator.hash_index.rebuild, 1), "файлов")
+
+            counter = iter(range(10 ** 9))
+
+            def save():
+                # Каждый раз новая форма, чтобы не срабатывала проверка дубликатов
+                number = next(counter)
+                bbcode = generator.generate_bbcode(f"{title} {number}", filled_questions, design)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    generator.save_results(f"save_{number}", filled_questions, bbcode, design,
+                                           generator.get_bbcode_hash(bbcode))
+
+            record("save", archive_size, time_stage(save, args.repeat), "файлов")
+            generator.hash_index.close()
+
+            # То же самое в базе SQLite: перенос архива и сохранение
+            generator.storage_backend = "sqlite"
+            storage = generator.get_storage()
+            record("migrate", archive_size, time_stage(lambda: storage.import_folder(folder), 1), "файлов")
+            record("save_sqlite", archive_size, time_stage(save, args.repeat), "форм")
+            storage.close()
+            generator.storage_backend = "folder"
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": generator.current_version,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results
+            }, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты записаны в {args.json}")
+    return 0
+
+
+def folder_size(folder):
+    """Место на диске, занятое файлами папки (в байтах)"""
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def bench_storage(args):
+    """Хранилища форм: занятое место и время сохранения (папка, SQLite, архив)"""
+    import tempfile
+
+    generator = ImprovedFormGenerator()
+    design = generator.designs["1"]
+    filled_questions = make_filled_questions(args.rows)
+
+    print(f"📋 Форм: {args.forms}, вопросов в форме: {args.rows}")
+    for backend in ("folder", "sqlite", "archive"):
+        with tempfile.TemporaryDirectory() as folder:
+            generator.output_folder = folder
+            generator.hash_index = HashIndex(folder)
+            generator.storage_backend = backend
+            storage = generator.get_storage()
+
+            times = []
+            for number in range(args.forms):
+                bbcode = generator.generate_bbcode(f"Форма {number}", filled_questions, design)
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    generator.save_results(f"form_{number}", filled_questions, bbcode, design,
+                                           generator.get_bbcode_hash(bbcode))
+                times.append(time.perf_counter() - started)
+
+            # Повторное сохранение последней формы - проверка дубликатов
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                generator.save_results(f"form_{number}", filled_questions, bbcode, design,
+                                       generator.get_bbcode_hash(bbcode))
+            duplicate = time.perf_counter() - started
+
+            generator.hash_index.close()
+            if backend != "folder":
+                storage.close()
+            size = folder_size(folder)
+            print(f"  {backend:<8} {size / 1024:10.1f} КБ   сохранение: медиана {statistics.median(times) * 1000:7.3f} мс, "
+                  f"p99 {sorted(times)[int(len(times) * 0.99)] * 1000:7.3f} мс   дубликат {duplicate * 1000:7.3f} мс")
+    return 0
+
+
+def bench_history(args):
+    """Много повторных сохранений одной формы: полные копии против истории версий"""
+    import tempfile
+
+    generator = ImprovedFormGenerator()
+    design = generator.designs["1"]
+    rng = random.Random(0)
+
+    print(f"📋 Сохранений формы: {args.saves}, вопросов в форме: {args.rows}")
+    for mode in ("copies", "history"):
+        with tempfile.TemporaryDirectory() as folder:
+            generator.output_folder = folder
+            generator.hash_index = HashIndex(folder)
+            generator.history = FormHistory(os.path.join(folder, "history"))
+            generator.storage_backend = "folder"
+            filled_questions = make_filled_questions(args.rows)
+
+            previous = None
+            started = time.perf_counter()
+            for number in range(args.saves):
+                # Как в меню: правится один ответ, и форма сохраняется снова
+                q = rng.choice(filled_questions)
+                q["answer"] = f"{q['answer'].split(' #')[0]} #{number}"
+                # Без истории каждая копия - новая пара файлов (в меню их разделяет время сохранения)
+                title = f"Заявка {number if mode == 'copies' else 0}"
+                bbcode = generator.generate_bbcode(title, filled_questions, design)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    saved, version = generator.save_results(title, filled_questions, bbcode, design,
+                                                            generator.get_bbcode_hash(bbcode), previous)
+                if mode == "history" and saved:
+                    previous = version
+            elapsed = time.perf_counter() - started
+            generator.hash_index.close()
+            size = folder_size(folder)
+
+            line = f"  {'полные копии' if mode == 'copies' else 'история':<13} {size / 1024:9.1f} КБ   " \
+                   f"сохранение {elapsed / args.saves * 1000:6.2f} мс"
+            if mode == "history":
+                name = generator.history.names()[0]
+                started = time.perf_counter()
+                state, bbcode = generator.rebuild_version(name)
+                rebuild = time.perf_counter() - started
+                if generator.get_bbcode_hash(bbcode) != state["bbcode_hash"]:
+                    print("❌ Последняя версия из истории не совпадает с сохраненной!")
+                    return 1
+                line += f"   сборка последней версии {rebuild * 1000:6.2f} мс"
+            print(line)
+    return 0
+
+
+def percentile(values, share):
+    """Значение, ниже которого лежит доля share замеров"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+async def load_client(host, port, requests, latencies, errors):
+    """Один клиент: все запросы по одному keep-alive соединению"""
+    import asyncio
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for path, body in requests:
+            started = time.perf_counter()
+            writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.decode("latin-1").split("\r\n"):
+                name, _, value = line.partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.setdefault(path, []).append(time.perf_counter() - started)
+            if not head.startswith(b"HTTP/1.1 200"):
+                errors.append(head.split(b"\r\n", 1)[0].decode("latin-1"))
+    finally:
+        writer.close()
+
+
+def bench_service(args):
+    """Нагрузка на HTTP-сервис: задержки p50/p99 по адресам и запросов в секунду"""
+    import asyncio
+    import socket
+    import tempfile
+
+    host, port = "127.0.0.1", args.port
+    process = None
+    if not args.port:
+        # Свой сервис на свободном порту
+        with socket.socket() as probe:
+            probe.bind((host, 0))
+            port = probe.getsockname()[1]
+        folder = os.path.dirname(os.path.abspath(__file__))
+        command = [sys.executable, os.path.join(folder, "form_generator.py"), "--serve", f"{host}:{port}",
+                   "--max-concurrent", str(args.max_concurrent)]
+        if args.workers is not None:
+            command += ["--workers", str(args.workers)]
+        # Кэш шаблонов сервиса пишется во временную папку, а не рядом со скриптом
+        workdir = tempfile.TemporaryDirectory()
+        process = subprocess.Popen(command, cwd=workdir.name, stderr=subprocess.DEVNULL)
+        for _ in range(100):
+            try:
+                socket.create_connection((host, port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+    form_text = make_form_text(args.rows).encode("utf-8")
+    filled_questions = [{"question": q["question"], "answer": q["answer"], "type": q["type"]}
+                        for q in make_filled_questions(args.rows)]
+    bodies = {
+        "/parse": json.dumps({"form": form_text.decode("utf-8")}, ensure_ascii=False).encode("utf-8"),
+        "/validate": json.dumps({"question": "Ваш реальный возраст", "answer": "19"}, ensure_ascii=False).encode("utf-8"),
+        "/render": json.dumps({"title": "Форма подачи заявления", "questions": filled_questions, "design": "1"},
+                              ensure_ascii=False).encode("utf-8"),
+    }
+    paths = list(bodies)
+    latencies, errors = {}, []
+
+    async def run():
+        clients = []
+        for client in range(args.clients):
+            requests = [(paths[(client + index) % len(paths)], bodies[paths[(client + index) % len(paths)]])
+                        for index in range(args.requests)]
+            clients.append(load_client(host, port, requests, latencies, errors))
+        await asyncio.gather(*clients)
+
+    try:
+        started = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - started
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            workdir.cleanup()
+
+    total = sum(len(times) for times in latencies.values())
+    print(f"📋 Клиентов: {args.clients}, запросов на клиента: {args.requests}, вопросов в форме: {args.rows}")
+    for path in paths:
+        times = latencies.get(path, [])
+        if times:
+            print(f"  {path:<10} {len(times):>7} запросов   p50 {percentile(times, 0.5) * 1000:8.2f} мс   "
+                  f"p99 {percentile(times, 0.99) * 1000:8.2f} мс")
+    print(f"⏱️  {total / elapsed:.0f} запросов в секунду")
+    if errors:
+        print(f"❌ Ошибок: {len(errors)} (первая: {errors[0]})")
+        return 1
+    return 0
+
+
+def bench_soak(args):
+    """Длинная интерактивная сессия: тысячи форм подряд через "заполнить новую форму"
+
+    Ввод с клавиатуры подменяется сценарием, вывод отбрасывается. Проверяется,
+    что глубина стека не растет от формы к форме, а память после прогрева
+    остается на одном уровне.
+    """
+    import builtins
+    import tracemalloc
+
+    def script():
+        for index in range(args.forms):
+            # Ввод формы, подтверждение, опции, заполнение, предпросмотр, стиль
+            yield from [f"Форма подачи {index}:", "1. Ваш игровой Никнейм:", "2. Ваш реальный возраст:", "", "",
+                        "y", "1", "", f"Ivan_{index}", "25", "1", str(index % 4 + 1)]
+            # Следующая форма или выход из меню результатов
+            yield from (["6", "y"] if index + 1 < args.forms else ["2", "y"])
+
+    import tempfile
+
+    generator = ImprovedFormGenerator()
+    generator.clear_screen = lambda: None
+    cache_folder = tempfile.TemporaryDirectory()
+    generator.parse_cache = ParseCache(cache_folder.name)
+    steps = script()
+    depths = [sys.maxsize, 0]
+    memory = []
+    forms_done = [0]
+
+    def scripted_input(prompt=""):
+        depth = 0
+        frame = sys._getframe()
+        while frame is not None:
+            depth += 1
+            frame = frame.f_back
+        depths[0] = min(depths[0], depth)
+        depths[1] = max(depths[1], depth)
+        answer = next(steps)
+        if prompt.startswith("Вы уверены, что хотите заполнить новую форму"):
+            forms_done[0] += 1
+            if forms_done[0] % args.sample == 0:
+                memory.append((forms_done[0], tracemalloc.get_traced_memory()[0]))
+        return answer
+
+    original_input = builtins.input
+    builtins.input = scripted_input
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            generator.run_workflow()
+    finally:
+        builtins.input = original_input
+        cache_folder.cleanup()
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+
+    print(f"📋 Форм за сессию: {args.forms}, время: {elapsed:.1f} с")
+    print(f"📚 Глубина стека: от {depths[0]} до {depths[1]}")
+    if len(memory) >= 2:
+        # Первый замер - после прогрева кэшей
+        growth = (memory[-1][1] - memory[0][1]) / 1024
+        print(f"💾 Память: {memory[0][1] / 1024:.0f} КБ после {memory[0][0]} форм, "
+              f"{memory[-1][1] / 1024:.0f} КБ после {memory[-1][0]} форм (рост {growth:.0f} КБ)")
+    else:
+        growth = 0
+    if depths[1] > depths[0] + 20:
+        print("❌ Глубина стека растет от формы к форме")
+        return 1
+    if growth > args.max_growth_kb:
+        print(f"❌ Память выросла больше чем на {args.max_growth_kb} КБ")
+        return 1
+    print("✅ Стек и память не растут")
+    return 0
+
+
+def displayed_text(bbcode):
+    """Как форум покажет BB-код: список (символ, оформление)
+    
+    Для видимого символа оформление - ближайший цвет, включенные [b]/[i]/[u]/[s]
+    и структурные теги вокруг; для пробелов цвет и жирность не видны.
+    """
+    stack = []
+    shown = []
+    position = 0
+    
+    def emit(text):
+        structure = tuple(tag for tag in stack if tag[0] not in INLINE_TAGS)
+        flags = frozenset(name for name, _ in stack if name in INLINE_TAGS and name != "color")
+        color = next((value for name, value in reversed(stack) if name == "color"), None)
+        for char in text:
+            if char.isspace():
+                shown.append((char, structure, flags & {"u", "s"}))
+            else:
+                shown.append((char, structure, flags, color))
+    
+    for match in BB_TAG_RE.finditer(bbcode):
+        emit(bbcode[position:match.start()])
+        position = match.end()
+        name, value = match.group(2).lower(), match.group(3)
+        if match.group(1):
+            stack.pop()
+        else:
+            stack.append((name, value.strip().lower() if value is not None else None))
+            if name not in INLINE_TAGS:
+                # Структурный тег сам по себе виден (начало ячейки, ссылки и т.п.)
+                shown.append((match.group(0),))
+    emit(bbcode[position:])
+    return shown
+
+
+# Граничные случаи minify_bbcode: слияние участков одного цвета с пустыми тегами
+MINIFY_EDGE_CASES = [
+    "[color=#fff]a[/color][color=#fff][/color]",
+    "[color=#fff]a[/color] [color=#fff][/color]",
+    "[color=#fff]a[/color][color=#fff][/color][color=#fff]b[/color]",
+    "[b][color=#fff]a[/color][color=#fff][/color][/b]",
+    "[color=#fff][color=#fff][/color][/color]",
+]
+
+
+def bench_minify(args):
+    """Сжатие BB-кода: сколько байт убирает minify_bbcode и сколько это стоит"""
+    generator = ImprovedFormGenerator()
+    filled_questions = make_filled_questions(args.rows)
+    title = "Форма подачи заявления"
+
+    for bbcode in MINIFY_EDGE_CASES:
+        minified = minify_bbcode(bbcode)
+        if displayed_text(bbcode) != displayed_text(minified) or not tags_balanced(minified):
+            print(f"❌ Сжатие {bbcode!r} дает {minified!r}: другой вид или незакрытые теги!")
+            return 1
+
+    print(f"📋 Строк в форме: {args.rows}, повторов: {args.repeat}")
+    for key, design in generator.designs.items():
+        bbcode = generator.generate_bbcode(title, filled_questions, design)
+        minified = minify_bbcode(bbcode)
+        if displayed_text(bbcode) != displayed_text(minified):
+            print(f"❌ Сжатый BB-код для стиля {key} выглядит иначе!")
+            return 1
+
+        before = len(bbcode.encode("utf-8"))
+        after = len(minified.encode("utf-8"))
+        elapsed = best_time(lambda: minify_bbcode(bbcode), args.repeat)
+        print(f"  [{key}] {design['name']}: {before} -> {after} байт "
+              f"(-{before - after}, {(before - after) / before:.1%}), {elapsed * 1000:.2f} мс")
+    return 0
+
+
+def tags_balanced(bbcode):
+    """Все теги BB-кода закрыты по порядку"""
+    stack = []
+    for match in BB_TAG_RE.finditer(bbcode):
+        name = match.group(2).lower()
+        if not match.group(1):
+            stack.append(name)
+        elif not stack or stack.pop() != name:
+            return False
+    return not stack
+
+
+def bench_split(args):
+    """Деление большой формы на посты: число постов, проверка и время"""
+    generator = ImprovedFormGenerator()
+    filled_questions = make_filled_questions(args.rows)
+    bbcode = generator.generate_bbcode("Форма подачи заявления", filled_questions, generator.designs["1"])
+    measure = utf8_length if args.bytes else len
+    unit = "байт" if args.bytes else "символов"
+    rows = bbcode.count("[tr]")
+
+    print(f"📋 Строк в форме: {args.rows}, BB-код: {measure(bbcode)} {unit}, повторов: {args.repeat}")
+    for limit in args.limits:
+        posts = split_bbcode(bbcode, limit, measure)
+        if any(measure(post) > limit or not tags_balanced(post) for post in posts):
+            print(f"❌ Лимит {limit}: пост длиннее лимита или с незакрытыми тегами!")
+            return 1
+        if sum(post.count("[tr]") for post in posts) != rows or "┌" in "".join(posts[1:]):
+            print(f"❌ Лимит {limit}: строки таблицы или шапка разложены неверно!")
+            return 1
+
+        elapsed = best_time(lambda: split_bbcode(bbcode, limit, measure), args.repeat)
+        print(f"  Лимит {limit} {unit}: постов {len(posts)}, {elapsed * 1000:.2f} мс")
+    return 0
+
+
+def bench_hash(args):
+    """Алгоритмы хэша: хэш готового текста и хэш по ходу перерисовки в меню"""
+    generator = ImprovedFormGenerator()
+    design = generator.designs["1"]
+    title = "Форма подачи заявления"
+    filled_questions = make_filled_questions(args.rows)
+    bbcode = generator.generate_bbcode(title, filled_questions, design)
+    counter = iter(range(10 ** 9))
+
+    def edit():
+        q = filled_questions[args.rows // 2]
+        q["answer"] = f"Новый ответ {next(counter)}"
+
+    print(f"📋 Строк в форме: {args.rows}, BB-код: {utf8_length(bbcode)} байт, повторов: {args.repeat}")
+    for algorithm in HASH_ALGORITHMS:
+        generator.hash_algorithm = algorithm
+        bbcode = generator.generate_bbcode(title, filled_questions, design)
+        if generator.render_form(title, filled_questions, design)[1] != hash_text(bbcode, algorithm):
+            print(f"❌ {algorithm}: хэш при перерисовке по строкам отличается от хэша текста!")
+            return 1
+
+        text_best = best_time(lambda: hash_text(bbcode, algorithm), args.repeat)
+
+        def full():
+            return generator.get_bbcode_hash(generator.generate_bbcode(title, filled_questions, design))
+
+        full_best = time_stage(full, args.repeat, edit)[0]
+        rows_best = time_stage(lambda: generator.render_form(title, filled_questions, design), args.repeat, edit)[0]
+        print(f"  {algorithm:8} хэш текста {text_best * 1000:6.2f} мс | правка: отрисовка + хэш "
+              f"{full_best * 1000:6.2f} мс, по строкам {rows_best * 1000:6.2f} мс")
+    return 0
+
+
+def bench_formats(args):
+    """BB-код, HTML и Markdown: каждый формат отдельно против всех за один проход"""
+    generator = ImprovedFormGenerator()
+    design = generator.designs["1"]
+    title = "Форма подачи заявления"
+    filled_questions = make_filled_questions(args.rows)
+
+    together = render_formats(title, filled_questions, design, tuple(EXPORT_FORMATS))
+    if together["bbcode"] != generator.generate_bbcode(title, filled_questions, design):
+        print("❌ BB-код из общего прохода отличается от generate_bbcode!")
+        return 1
+
+    print(f"📋 Строк в форме: {args.rows}, повторов: {args.repeat}")
+    bbcode_best = best_time(lambda: generator.generate_bbcode(title, filled_questions, design), args.repeat)
+    print(f"  generate_bbcode:           {bbcode_best * 1000:.2f} мс")
+    separate = 0
+    for name in EXPORT_FORMATS:
+        elapsed = best_time(lambda: render_formats(title, filled_questions, design, (name,)), args.repeat)
+        separate += elapsed
+        print(f"  {name + ' отдельно:':26} {elapsed * 1000:.2f} мс")
+    one_pass = best_time(lambda: render_formats(title, filled_questions, design, tuple(EXPORT_FORMATS)),
+                         args.repeat)
+    print(f"  Три прохода подряд:        {separate * 1000:.2f} мс")
+    print(f"  Все форматы за один проход: {one_pass * 1000:.2f} мс "
+          f"(x{one_pass / bbcode_best:.2f} от generate_bbcode, x{separate / one_pass:.2f} быстрее трёх проходов)")
+
+    # Первая отрисовка формы: готовых строк в кэше еще нет (справочно, без цели)
+    plans = [plan_class.for_design(design) for plan_class in EXPORT_FORMATS.values()]
+
+    def first_pass():
+        for plan in plans:
+            plan.format_rows.clear()
+        render_formats(title, filled_questions, design, tuple(EXPORT_FORMATS))
+
+    cold = best_time(first_pass, args.repeat)
+    print(f"  Первый проход (кэш строк пуст): {cold * 1000:.2f} мс (x{cold / bbcode_best:.2f} от generate_bbcode)")
+
+    # Цель - все форматы почти по цене одной отрисовки BB-кода
+    if one_pass / bbcode_best > args.target:
+        print(f"❌ Цель x{args.target:.1f} от generate_bbcode не достигнута")
+        return 1
+    print(f"✅ Укладываемся в цель x{args.target:.1f} от generate_bbcode")
+    return 0
+
+
+def bench_updates(args):
+    """Проверка обновлений против локального сервера-заглушки version.txt
+
+    Сервер отдает версию с ETag, отвечает 304 на If-None-Match и может
+    отвечать с задержкой. Проверяются ответ 200, запрос раз в день, ответ 304,
+    неблокирующий старт и работа без сети.
+    """
+    import http.server
+    import tempfile
+    import threading
+
+    class StubHandler(http.server.BaseHTTPRequestHandler):
+        version = "9.9.9"
+        delay = 0
+        requests = []
+
+        def do_GET(self):
+            StubHandler.requests.append(dict(self.headers))
+            time.sleep(StubHandler.delay)
+            etag = f'"{StubHandler.version}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = f"version = {StubHandler.version}\n".encode("utf-8")
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/version.txt"
+    failures = []
+
+    def check(name, condition):
+        print(f"  {'✅' if condition else '❌'} {name}")
+        if not condition:
+            failures.append(name)
+
+    def start_check(generator, **stub):
+        # Запуск как в main(): проверка в фоне, ждем ее окончания
+        StubHandler.requests = []
+        StubHandler.delay = stub.get("delay", 0)
+        StubHandler.version = stub.get("version", StubHandler.version)
+        started = time.perf_counter()
+        thread = generator.check_for_updates_on_start()
+        returned = time.perf_counter() - started
+        thread.join(10)
+        return returned
+
+    with tempfile.TemporaryDirectory() as folder:
+        generator = ImprovedFormGenerator()
+        generator.update_check_url = url
+        generator.update_cache_file = os.path.join(folder, "update_cache.json")
+
+        print("📋 Первый запуск (кэша нет)")
+        start_check(generator)
+        cache = generator.load_update_cache()
+        check("один запрос, ответ 200", len(StubHandler.requests) == 1)
+        check("найдено обновление 9.9.9", generator.available_update == "9.9.9")
+        check("ETag и время проверки в кэше", cache.get("etag") == '"9.9.9"' and "checked" in cache)
+
+        print("📋 Повторный запуск в тот же день")
+        generator.available_update = None
+        start_check(generator)
+        check("в сеть не ходили", not StubHandler.requests)
+        check("версия взята из кэша", generator.available_update == "9.9.9")
+
+        print("📋 Запуск через сутки, файл не менялся")
+        cache["checked"] = (datetime.datetime.now() - datetime.timedelta(days=1, minutes=1)).isoformat()
+        generator.save_update_cache(cache)
+        generator.available_update = None
+        start_check(generator)
+        sent = StubHandler.requests[0] if StubHandler.requests else {}
+        check("условный запрос с If-None-Match", sent.get("If-None-Match") == '"9.9.9"')
+        check("ответ 304, версия из кэша", generator.available_update == "9.9.9")
+        check("время проверки обновлено", generator.update_checked_recently(generator.load_update_cache()))
+
+        print("📋 Проверка из меню (без ограничения раз в день), вышла 10.0.0")
+        StubHandler.requests = []
+        StubHandler.version = "10.0.0"
+        check("найдена версия 10.0.0", generator.check_for_updates(silent=True)
+              and generator.available_update == "10.0.0")
+        check("один запрос", len(StubHandler.requests) == 1)
+
+        print(f"📋 Медленный сервер ({args.delay:.1f} с)")
+        generator.update_check_interval = datetime.timedelta(0)
+        returned = start_check(generator, delay=args.delay)
+        check(f"меню не ждет сеть (старт за {returned * 1000:.1f} мс)", returned < min(args.delay / 2, 0.1))
+
+        print("📋 Нет сети")
+        server.shutdown()
+        server.server_close()
+        generator.available_update = None
+        start_check(generator)
+        check("показана версия из кэша", generator.available_update == "10.0.0")
+
+    if failures:
+        print(f"❌ Не прошло проверок: {len(failures)}")
+        return 1
+    print("✅ Все проверки обновлений прошли")
+    return 0
+
+
+def bench_compare(args):
+    """Сравнение двух файлов результатов suite (например, двух версий)"""
+    def load(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data, {(r["stage"], r["size"]): r for r in data["results"]}
+
+    old_data, old_results = load(args.old)
+    new_data, new_results = load(args.new)
+    print(f"📊 {args.old} ({old_data['version']}) → {args.new} ({new_data['version']})")
+
+    regressions = 0
+    for key, new in new_results.items():
+        old = old_results.get(key)
+        if not old:
+            continue
+        ratio = new["median_s"] / old["median_s"] if old["median_s"] else 1.0
+        mark = "❌" if ratio > 1 + args.tolerance else "✅"
+        if mark == "❌":
+            regressions += 1
+        print(f"  {mark} {key[0]:<15} {key[1]:>7}: {old['median_s'] * 1000:9.3f} мс → "
+              f"{new['median_s'] * 1000:9.3f} мс (x{ratio:.2f})")
+    return 1 if regressions else 0
+
+
+def bench_startup(args):
+    """Холодный старт: python -X importtime, импорт модуля и создание генератора"""
+    code = "import form_generator; form_generator.ImprovedFormGenerator()"
+    folder = os.path.dirname(os.path.abspath(__file__))
+
+    import_times = []
+    wall_times = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                                 cwd=folder, capture_output=True, text=True)
+        wall_times.append(time.perf_counter() - started)
+        if process.returncode != 0:
+            print(process.stderr)
+            return 1
+
+        # Строка вида "import time:  self [us] | cumulative | form_generator"
+        for line in process.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == "form_generator":
+                import_times.append(int(parts[1]) / 1000)
+
+    import_ms = statistics.median(import_times)
+    wall_ms = statistics.median(wall_times) * 1000
+    print(f"📦 Импорт form_generator (медиана из {args.repeat}): {import_ms:.1f} мс")
+    print(f"⏱️  Запуск процесса целиком: {wall_ms:.1f} мс")
+
+    if import_ms > args.target_ms:
+        print(f"❌ Превышена цель {args.target_ms:.0f} мс")
+        return 1
+    print(f"✅ Укладываемся в цель {args.target_ms:.0f} мс")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности генератора форм")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="скорость generate_bbcode")
+    render.add_argument("--rows", type=int, default=1000, help="количество строк в форме")
+    render.add_argument("--repeat", type=int, default=20, help="количество повторов замера")
+    render.set_defaults(func=bench_render)
+
+    rerender = commands.add_parser("rerender", help="перерисовка формы после правки одного ответа")
+    rerender.add_argument("--rows", type=int, default=10000, help="количество строк в форме")
+    rerender.add_argument("--repeat", type=int, default=20, help="количество правок")
+    rerender.set_defaults(func=bench_rerender)
+
+    classify = commands.add_parser("classify", help="классификация вопросов: сверка с прежней и скорость")
+    classify.add_argument("--questions", type=int, default=30000, help="количество случайных вопросов")
+    classify.add_argument("--seed", type=int, default=0, help="зерно генератора случайных вопросов")
+    classify.add_argument("--repeat", type=int, default=5, help="количество повторов замера")
+    classify.set_defaults(func=bench_classify)
+
+    parallel = commands.add_parser("parallel", help="отрисовка множества форм в пуле из 1..N процессов")
+    parallel.add_argument("--forms", type=int, default=2000, help="количество форм")
+    parallel.add_argument("--rows", type=int, default=30, help="количество вопросов в форме")
+    parallel.add_argument("--max-workers", type=int, default=0, help="до скольких процессов (по умолчанию по числу ядер)")
+    parallel.add_argument("--chunk-size", type=int, default=64, help="форм в одной пачке")
+    parallel.set_defaults(func=bench_parallel)
+
+    suite = commands.add_parser("suite", help="все этапы на формах и архивах разного размера")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[12, 100, 1000, 10000],
+                       help="количество вопросов в формах")
+    suite.add_argument("--archives", type=int, nargs="+", default=[100, 1000, 10000],
+                       help="количество сохраненных форм в архиве (можно до 100000)")
+    suite.add_argument("--repeat", type=int, default=5, help="количество повторов замера")
+    suite.add_argument("--json", metavar="RESULTS.json", help="куда записать результаты")
+    suite.set_defaults(func=bench_suite)
+
+    storage = commands.add_parser("storage", help="хранилища форм: место на диске и время сохранения")
+    storage.add_argument("--forms", type=int, default=1000, help="количество сохраняемых форм")
+    storage.add_argument("--rows", type=int, default=12, help="количество вопросов в форме")
+    storage.set_defaults(func=bench_storage)
+
+    service = commands.add_parser("service", help="нагрузка на HTTP-сервис (задержки p50/p99)")
+    service.add_argument("--clients", type=int, default=32, help="количество одновременных соединений")
+    service.add_argument("--requests", type=int, default=200, help="запросов на одно соединение")
+    service.add_argument("--rows", type=int, default=12, help="количество вопросов в форме")
+    service.add_argument("--port", type=int, default=0,
+                         help="порт уже запущенного сервиса (по умолчанию запускается свой)")
+    service.add_argument("--max-concurrent", type=int, default=64, help="ограничение запросов у своего сервиса")
+    service.add_argument("--workers", type=int, default=None, help="процессов отрисовки у своего сервиса")
+    service.set_defaults(func=bench_service)
+
+    soak = commands.add_parser("soak", help="длинная сессия меню: стек и память не должны расти")
+    soak.add_argument("--forms", type=int, default=3000, help="количество форм за одну сессию")
+    soak.add_argument("--sample", type=int, default=500, help="замер памяти каждые N форм")
+    soak.add_argument("--max-growth-kb", type=float, default=512, help="допустимый рост памяти после прогрева, КБ")
+    soak.set_defaults(func=bench_soak)
+
+    minify = commands.add_parser("minify", help="сжатие BB-кода: сэкономленные байты и время")
+    minify.add_argument("--rows", type=int, default=1000, help="количество строк в форме")
+    minify.add_argument("--repeat", type=int, default=20, help="количество повторов замера")
+    minify.set_defaults(func=bench_minify)
+
+    split = commands.add_parser("split", help="деление большой формы на посты по лимиту длины")
+    split.add_argument("--rows", type=int, default=10000, help="количество строк в форме")
+    split.add_argument("--limits", type=int, nargs="+", default=[10000, 30000, 100000],
+                       help="лимиты длины поста")
+    split.add_argument("--bytes", action="store_true", help="лимит в байтах UTF-8, а не в символах")
+    split.add_argument("--repeat", type=int, default=5, help="количество повторов замера")
+    split.set_defaults(func=bench_split)
+
+    hashing = commands.add_parser("hash", help="алгоритмы хэша BB-кода (md5, blake2b, sha256)")
+    hashing.add_argument("--rows", type=int, default=10000, help="количество строк в форме")
+    hashing.add_argument("--repeat", type=int, default=20, help="количество повторов замера")
+    hashing.set_defaults(func=bench_hash)
+
+    formats = commands.add_parser("formats", help="BB-код, HTML и Markdown за один проход")
+    formats.add_argument("--rows", type=int, default=1000, help="количество строк в форме")
+    formats.add_argument("--repeat", type=int, default=20, help="количество повторов замера")
+    formats.add_argument("--target", type=float, default=1.5,
+                         help="допустимое время всех форматов за проход, в разах от generate_bbcode")
+    formats.set_defaults(func=bench_formats)
+
+    history = commands.add_parser("history", help="повторные сохранения формы: полные копии против истории версий")
+    history.add_argument("--saves", type=int, default=200, help="сколько раз форма сохраняется после правки")
+    history.add_argument("--rows", type=int, default=30, help="количество вопросов в форме")
+    history.set_defaults(func=bench_history)
+
+    updates = commands.add_parser("updates", help="проверка обновлений против локального сервера-заглушки")
+    updates.add_argument("--delay", type=float, default=1.0, help="задержка ответа медленного сервера, с")
+    updates.set_defaults(func=bench_updates)
+
+    compare = commands.add_parser("compare", help="сравнить два файла результатов suite")
+    compare.add_argument("old", help="результаты старой версии")
+    compare.add_argument("new", help="результаты новой версии")
+    compare.add_argument("--tolerance", type=float, default=0.1,
+                         help="допустимое замедление (0.1 = 10%%)")
+    compare.set_defaults(func=bench_compare)
+
+    startup = commands.add_parser("startup", help="время холодного старта (-X importtime)")
+    startup.add_argument("--repeat", type=int, default=10, help="количество запусков")
+    startup.add_argument("--target-ms", type=float, default=25.0,
+                         help="допустимое время импорта form_generator, мс")
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,19 +6,2171 @@
 Версия: 1.1.0
 """
 
-import json
 import os
 import re
-import hashlib
-import urllib.request
-import urllib.error
 import datetime
-import webbrowser
-import tempfile
 import sys
-from pathlib import Path
+
+# Остальные модули (json, hashlib, urllib, webbrowser, sqlite3) импортируются
+# внутри функций, которым они нужны, - так программа быстрее запускается
+
+# Группы ключевых слов для классификации вопросов
+FIELD_KEYWORDS = {
+    # Типы полей (detect_field_type)
+    "screenshot": ["скриншот", "screenshot", "/time", "статистик", "статистики"],
+    "link": ["ссылка", "url", "сайт", "профиль", "биографи", "биография", "vk", "вк", "дискорд"],
+    "multiline": ["почему", "расскажите", "обоснование", "считаете"],
+    # Проверки ответов (validate_input)
+    "age": ["возраст", "лет", "годиков", "года", "годков", "age", "сколько лет"],
+    "nickname": ["никнейм", "ник", "логин", "nickname", "nick"],
+    "level": ["уровень", "level", "lvl"],
+    "timezone": ["часовой пояс", "таймзона", "timezone", "часовой"],
+    # Подписи ссылок (generate_bbcode)
+    "label_vk": ["vk", "вк"],
+    "label_discord": ["discord", "дискорд"],
+    "label_biography": ["биограф"],
+}
+
+# Признаки часового пояса в ответе
+TIMEZONE_ANSWER_RE = re.compile(r'gmt|utc|msk|\+|-')
+
+
+class KeywordClassifier:
+    """Классификатор вопросов по группам ключевых слов за один проход
+    
+    Все ключевые слова собираются в одно регулярное выражение, которое
+    проверяет каждую позицию текста один раз. Для каждого слова заранее
+    известны категории всех слов, которые являются его началом, поэтому
+    даже при пересечении слов возвращаются все подходящие категории.
+    """
+    
+    def __init__(self, groups, cache_size=4096):
+        import functools
+        self.groups = groups
+        self.cache_size = cache_size
+        self.categories = None
+        self.pattern = None
+        # Вопросы повторяются при каждой повторной проверке ответа - кэшируем
+        self._cached_classify = functools.lru_cache(maxsize=cache_size)(self._classify)
+    
+    def compile(self):
+        """Сборка регулярного выражения (выполняется один раз, при первом вызове)"""
+        categories_by_word = {}
+        for category, words in self.groups.items():
+            for word in words:
+                categories_by_word.setdefault(word.lower(), set()).add(category)
+        
+        # Слово совпало - значит совпали и все слова, являющиеся его началом
+        categories = {}
+        for word in categories_by_word:
+            matched = set()
+            for other, word_categories in categories_by_word.items():
+                if word.startswith(other):
+                    matched |= word_categories
+            categories[word] = frozenset(matched)
+        self.categories = categories
+        
+        # Сначала длинные слова, чтобы в каждой позиции находилось самое длинное
+        words = sorted(categories_by_word, key=len, reverse=True)
+        self.pattern = re.compile("(?=(" + "|".join(re.escape(word) for word in words) + "))")
+    
+    def classify(self, text):
+        """Множество категорий для текста (первый вызов собирает классификатор)"""
+        return self._cached_classify(text)
+    
+    def cache_clear(self):
+        """Сброс кэша результатов классификации"""
+        self._cached_classify.cache_clear()
+    
+    def _classify(self, text):
+        """Множество категорий, ключевые слова которых встречаются в тексте"""
+        if self.pattern is None:
+            self.compile()
+        found = set()
+        categories = self.categories
+        for match in self.pattern.finditer(text.lower()):
+            found |= categories[match.group(1)]
+        return frozenset(found)
+
+
+FIELD_CLASSIFIER = KeywordClassifier(FIELD_KEYWORDS)
+
+
+# Правила проверки ответов (validate_input). Правило применяется, если вопрос
+# относится к категории "category" из FIELD_KEYWORDS или поле имеет один из
+# типов "field_types". Правила проверяются по порядку, первое сработавшее
+# правило определяет результат.
+VALIDATION_RULES = [
+    {"category": "age", "check": "int_range", "min": 14, "max": 100, "warn_below": 18,
+     "not_int": "⚠️  Возраст должен быть целым числом.",
+     "out_of_range": "⚠️  Возраст должен быть в диапазоне от 14 до 100 лет.",
+     "warning": "⚠️  Внимание: вам меньше 18 лет. Убедитесь, что это правильно."},
+    {"category": "nickname", "check": "length", "min": 3, "max": 25,
+     "empty": "⚠️  Никнейм не может быть пустым.",
+     "too_long": "⚠️  Никнейм слишком длинный (максимум 25 символов).",
+     "too_short": "⚠️  Никнейм слишком короткий (минимум 3 символа)."},
+    {"category": "level", "check": "int_range", "min": 1, "max": 100,
+     "not_int": "⚠️  Уровень должен быть целым числом.",
+     "out_of_range": "⚠️  Уровень должен быть в диапазоне от 1 до 100."},
+    {"category": "timezone", "check": "pattern", "pattern": TIMEZONE_ANSWER_RE,
+     "warning": "⚠️  Убедитесь, что правильно указали часовой пояс (например, GMT+3, UTC+5, MSK)."},
+    {"field_types": ("link", "screenshot"), "check": "prefix", "prefixes": ("http://", "https://"),
+     "error": "⚠️  Ссылка должна начинаться с http:// или https://"},
+    {"field_types": ("text",), "check": "short", "min": 2,
+     "warning": "⚠️  Ответ очень короткий. Убедитесь, что это правильно."},
+]
+
+ANSWER_ACCEPTED = "✅ Ответ принят"
+
+
+class AnswerRules:
+    """Проверка ответов по таблице правил
+    
+    Для каждого сочетания категорий вопроса и типа поля один раз собирается
+    список подходящих проверок. Столбец ответов на один вопрос проверяется
+    пачкой: каждая проверка проходит по всем ответам сразу, а одинаковые
+    ответы проверяются один раз.
+    """
+    
+    def __init__(self, rules, classifier):
+        self.rules = rules
+        self.classifier = classifier
+        self.plans = {}
+    
+    def plan(self, question_text, field_type):
+        """Проверки (функция, правило) для вопроса, в порядке таблицы"""
+        key = (self.classifier.classify(question_text), field_type)
+        plan = self.plans.get(key)
+        if plan is None:
+            categories = key[0]
+            plan = self.plans[key] = tuple(
+                (getattr(self, "check_" + rule["check"]), rule) for rule in self.rules
+                if rule.get("category") in categories or field_type in rule.get("field_types", ()))
+        return plan
+    
+    def validate(self, question_text, answer, field_type):
+        """(ответ допустим, сообщение) для одного ответа"""
+        for check, rule in self.plan(question_text, field_type):
+            result = check(rule, answer)
+            if result is not None:
+                return result
+        return True, ANSWER_ACCEPTED
+    
+    def validate_column(self, question_text, answers, field_type):
+        """Результаты validate для всех ответов на один вопрос, в том же порядке"""
+        # Одинаковые ответы (возраст, уровень) проверяются один раз
+        distinct = list(dict.fromkeys(answers))
+        outcomes = [None] * len(distinct)
+        
+        # Каждая проверка получает только ответы, которые еще ничем не закончились
+        pending = range(len(distinct))
+        for check, rule in self.plan(question_text, field_type):
+            if not pending:
+                break
+            values = [distinct[index] for index in pending] if len(pending) < len(distinct) else distinct
+            column = getattr(self, "column_" + rule["check"], None)
+            results = column(rule, values) if column else [check(rule, value) for value in values]
+            
+            still_pending = []
+            for index, result in zip(pending, results):
+                if result is None:
+                    still_pending.append(index)
+                else:
+                    outcomes[index] = result
+            pending = still_pending
+        
+        accepted = (True, ANSWER_ACCEPTED)
+        outcomes = [outcome or accepted for outcome in outcomes]
+        if len(distinct) == len(answers):
+            return outcomes
+        by_answer = dict(zip(distinct, outcomes))
+        return [by_answer[answer] for answer in answers]
+    
+    # Проверки: None - проверка пройдена, иначе (ответ допустим, сообщение)
+    
+    def check_int_range(self, rule, answer):
+        try:
+            value = int(answer)
+        except ValueError:
+            return False, rule["not_int"]
+        if value < rule["min"] or value > rule["max"]:
+            return False, rule["out_of_range"]
+        if "warn_below" in rule and value < rule["warn_below"]:
+            return True, rule["warning"]
+        return None
+    
+    def column_int_range(self, rule, answers):
+        """check_int_range для списка ответов одним циклом"""
+        low, high = rule["min"], rule["max"]
+        warn_below = rule.get("warn_below", low)
+        not_int = (False, rule["not_int"])
+        out_of_range = (False, rule["out_of_range"])
+        warning = (True, rule.get("warning"))
+        
+        results = []
+        append = results.append
+        for answer in answers:
+            try:
+                value = int(answer)
+            except ValueError:
+                append(not_int)
+                continue
+            append(out_of_range if value < low or value > high else warning if value < warn_below else None)
+        return results
+    
+    def check_length(self, rule, answer):
+        if not answer.strip():
+            return False, rule["empty"]
+        if len(answer) > rule["max"]:
+            return False, rule["too_long"]
+        if len(answer) < rule["min"]:
+            return False, rule["too_short"]
+        return None
+    
+    def check_pattern(self, rule, answer):
+        if not rule["pattern"].search(answer.lower()):
+            return True, rule["warning"]
+        return None
+    
+    def check_prefix(self, rule, answer):
+        if not answer.startswith(rule["prefixes"]):
+            return False, rule["error"]
+        return None
+    
+    def check_short(self, rule, answer):
+        if len(answer.strip()) < rule["min"]:
+            return True, rule["warning"]
+        return None
+
+
+ANSWER_RULES = AnswerRules(VALIDATION_RULES, FIELD_CLASSIFIER)
+
+
+class NullStats:
+    """Заглушка статистики: используется, пока замеры выключены"""
+    
+    enabled = False
+    
+    def count(self, name, value=1):
+        pass
+
+
+NULL_STATS = NullStats()
+
+
+class StageStats:
+    """Время и счетчики этапов работы генератора
+    
+    Включается через ImprovedFormGenerator.enable_stats(): методы этапов
+    оборачиваются замером только в этот момент, поэтому без --stats
+    программа работает без каких-либо накладных расходов.
+    """
+    
+    enabled = True
+    
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._depth = {}
+    
+    def wrap(self, stage, func):
+        """Обертка, которая считает вызовы и время этапа"""
+        import functools
+        import time
+        
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            # Вложенные вызовы того же этапа (рекурсия) не удваивают время
+            depth = self._depth.get(stage, 0)
+            self._depth[stage] = depth + 1
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._depth[stage] = depth
+                entry = self.stages.setdefault(stage, {"calls": 0, "seconds": 0.0})
+                entry["calls"] += 1
+                if depth == 0:
+                    entry["seconds"] += time.perf_counter() - started
+        
+        return timed
+    
+    def count(self, name, value=1):
+        """Увеличение счетчика (байты, файлы, задания)"""
+        self.counters[name] = self.counters.get(name, 0) + value
+    
+    def as_dict(self):
+        return {
+            "stages": {name: {"calls": entry["calls"], "seconds": round(entry["seconds"], 6)}
+                       for name, entry in self.stages.items()},
+            "counters": dict(self.counters)
+        }
+    
+    def take(self):
+        """Накопленная статистика (как as_dict, без округления) со сбросом
+        
+        Так процесс пула отдает свои замеры вместе с каждой пачкой, а не
+        теряет их при завершении.
+        """
+        taken = {"stages": self.stages, "counters": self.counters}
+        self.stages = {}
+        self.counters = {}
+        return taken
+    
+    def merge(self, other):
+        """Добавление статистики из другого процесса (результат take или as_dict)"""
+        for name, entry in other["stages"].items():
+            own = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+            own["calls"] += entry["calls"]
+            own["seconds"] += entry["seconds"]
+        for name, value in other["counters"].items():
+            self.count(name, value)
+    
+    def write(self, path):
+        """Запись статистики в JSON-файл или в stderr ("-")"""
+        import json
+        
+        text = json.dumps(self.as_dict(), ensure_ascii=False, indent=2)
+        if path == "-":
+            print(text, file=sys.stderr)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+
+
+class Question:
+    """Компактная запись вопроса формы
+    
+    Одна и та же запись используется при разборе, заполнении, отрисовке
+    и сохранении. Тип поля хранится как общая (интернированная) строка,
+    а заполненный вопрос ссылается на те же строки, что и исходный.
+    Для совместимости запись понимает обращение как к словарю:
+    q["number"], q["clean"], q["question"] (то же, что clean), q["answer"].
+    """
+    
+    __slots__ = ("number", "original", "clean", "type", "answer")
+    
+    # Ключи словаря -> поля записи
+    KEYS = {"number": "number", "original": "original", "clean": "clean",
+            "question": "clean", "type": "type", "answer": "answer"}
+    
+    def __init__(self, number, original, clean, field_type, answer=None):
+        self.number = number
+        self.original = original
+        self.clean = clean
+        self.type = sys.intern(field_type)
+        self.answer = answer
+    
+    @property
+    def question(self):
+        return self.clean
+    
+    def with_answer(self, answer):
+        """Заполненный вопрос (строки вопроса общие с исходной записью)"""
+        return Question(self.number, self.original, self.clean, self.type, answer)
+    
+    def copy(self):
+        return Question(self.number, self.original, self.clean, self.type, self.answer)
+    
+    def to_dict(self):
+        """Словарь в формате .json файлов (вопрос формы или заполненный вопрос)"""
+        if self.answer is None:
+            return {"number": self.number, "original": self.original, "clean": self.clean, "type": self.type}
+        return {"number": self.number, "question": self.clean, "original": self.original,
+                "answer": self.answer, "type": self.type}
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Запись из словаря любого из двух форматов"""
+        if isinstance(data, cls):
+            return data.copy()
+        clean = data["clean"] if "clean" in data else data["question"]
+        return cls(data["number"], data["original"], clean, data["type"], data.get("answer"))
+    
+    @classmethod
+    def coerce(cls, data):
+        """Запись Question как есть, словарь - в новую запись"""
+        return data if isinstance(data, cls) else cls.from_dict(data)
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self.KEYS[key])
+        except KeyError:
+            raise KeyError(key) from None
+    
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, self.KEYS[key], value)
+        except KeyError:
+            raise KeyError(key) from None
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def keys(self):
+        return self.to_dict().keys()
+    
+    def __eq__(self, other):
+        if isinstance(other, (Question, dict)):
+            return self.to_dict() == (other.to_dict() if isinstance(other, Question) else other)
+        return NotImplemented
+    
+    def __repr__(self):
+        return f"Question({self.to_dict()!r})"
+
+
+def iter_row_fields(filled_questions):
+    """(номер, вопрос, ответ, тип) для записей Question и для словарей"""
+    for q in filled_questions:
+        if q.__class__ is Question:
+            yield q.number, q.clean, q.answer, q.type
+        else:
+            yield q["number"], q["question"], q["answer"], q["type"]
+
+
+def questions_to_json(questions):
+    """Список вопросов в формате .json файлов"""
+    return [q.to_dict() if isinstance(q, Question) else q for q in questions]
+
+
+# Начало вопроса: "1." или "1)"
+QUESTION_START_RE = re.compile(r'^\d+[\.\)]\s*')
+
+# Слова, по которым узнается заголовок формы
+TITLE_WORDS = ["форма", "заявление", "анкета", "заявка"]
+FALLBACK_TITLE_WORDS = ["форма", "заявление", "анкета"]
+
+
+class FormStreamParser:
+    """Потоковый разбор формы
+    
+    Принимает любой источник строк (файл, stdin, список строк) и выдает
+    вопросы по одному, как только вопрос закончился. В памяти хранится
+    только текущий вопрос. Заголовок доступен в self.title и окончательно
+    известен после разбора всего текста.
+    """
+    
+    def __init__(self, generator, lines):
+        self.generator = generator
+        self.lines = lines
+        self.title = "ФОРМА ЗАЯВЛЕНИЯ"
+        self.title_found = False
+        self.fallback_title = "ФОРМА ЗАЯВЛЕНИЯ"
+        self.count = 0
+    
+    def make_question(self, parts):
+        """Запись вопроса из накопленных строк (или None для пустого)"""
+        question_text = ' '.join(parts).strip()
+        if not question_text:
+            return None
+        self.count += 1
+        return Question(self.count, question_text,
+                        self.generator.clean_question_text(question_text),
+                        self.generator.detect_field_type(question_text))
+    
+    def __iter__(self):
+        current_question = []
+        
+        for line in self.lines:
+            line = line.rstrip()
+            if not line.strip():
+                continue
+            
+            # Заголовок - первая строка с ключевым словом; запасной вариант
+            # (если вопросов не найдется) - последняя такая строка
+            line_lower = line.lower()
+            if not self.title_found and any(word in line_lower for word in TITLE_WORDS):
+                self.title = line
+                self.title_found = True
+            if any(word in line_lower for word in FALLBACK_TITLE_WORDS):
+                self.fallback_title = line
+            
+            if QUESTION_START_RE.match(line):
+                # Новый вопрос - отдаем предыдущий
+                if current_question:
+                    question = self.make_question(current_question)
+                    if question:
+                        yield question
+                current_question = [line]
+            elif current_question:
+                # Продолжение вопроса (многострочные вопросы)
+                current_question.append(line)
+        
+        # Последний вопрос
+        if current_question:
+            question = self.make_question(current_question)
+            if question:
+                yield question
+        
+        if not self.count:
+            self.title = self.fallback_title
+
+
+class ParseCache:
+    """Кэш разобранных форм на диске
+    
+    Ключ - хэш нормализованного текста формы (без пустых строк и пробелов
+    в конце строк), поэтому повторная вставка того же шаблона не требует ни
+    разбора, ни классификации вопросов. Старые записи вытесняются (LRU по
+    времени последнего использования файла). С folder=None кэш живет только
+    в памяти и ничего не пишет на диск.
+    """
+    
+    # Меняется вместе с правилами разбора и классификации, чтобы не отдавать
+    # результаты, посчитанные по старым правилам
+    VERSION = 1
+    
+    def __init__(self, folder, max_entries=256, stats=NULL_STATS):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.stats = stats
+        self._memory = {}
+        self._disk_count = None
+    
+    def key(self, lines):
+        """Ключ кэша для строк формы"""
+        import hashlib
+        
+        digest = hashlib.sha256(f"v{self.VERSION}\n".encode('utf-8'))
+        for line in lines:
+            line = line.rstrip()
+            if line.strip():
+                digest.update(line.encode('utf-8'))
+                digest.update(b"\n")
+        return digest.hexdigest()
+    
+    def get(self, key):
+        """(заголовок, вопросы) из кэша или None"""
+        import json
+        
+        entry = self._memory.get(key)
+        if entry is None and self.folder is None:
+            self.stats.count("parse_cache.misses")
+            return None
+        if entry is None:
+            path = os.path.join(self.folder, key + ".json")
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                entry = (data["title"], [Question.from_dict(q) for q in data["questions"]])
+                os.utime(path)  # Отмечаем использование для LRU
+            except (OSError, ValueError, KeyError, TypeError):
+                self.stats.count("parse_cache.misses")
+                return None
+            self._remember(key, entry)
+        
+        self.stats.count("parse_cache.hits")
+        title, questions = entry
+        # Вопросы потом изменяются (удаление, перенумерация) - отдаем копии
+        return title, [q.copy() for q in questions]
+    
+    def put(self, key, title, questions):
+        """Сохранение результата разбора"""
+        import json
+        
+        if self.max_entries <= 0:
+            return
+        entry = (title, [Question.from_dict(q) for q in questions])
+        self._remember(key, entry)
+        if self.folder is None:
+            return
+        
+        try:
+            if not os.path.exists(self.folder):
+                os.makedirs(self.folder)
+            path = os.path.join(self.folder, key + ".json")
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"title": title, "questions": questions_to_json(questions)}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            
+            if self._disk_count is None:
+                self._disk_count = len(os.listdir(self.folder))
+            else:
+                self._disk_count += 1
+            if self._disk_count > self.max_entries:
+                self.evict()
+        except OSError:
+            # Кэш - не обязательная часть, ошибки диска не мешают работе
+            pass
+    
+    def _remember(self, key, entry):
+        """Запись в память (словарь хранит порядок использования)"""
+        self._memory.pop(key, None)
+        self._memory[key] = entry
+        if len(self._memory) > self.max_entries:
+            del self._memory[next(iter(self._memory))]
+    
+    def evict(self):
+        """Удаление давно не использованных записей сверх max_entries"""
+        entries = []
+        for file_name in os.listdir(self.folder):
+            path = os.path.join(self.folder, file_name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        
+        entries.sort()
+        extra = len(entries) - self.max_entries
+        for _, path in entries[:max(extra, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._disk_count = min(len(entries), self.max_entries)
+
+
+# Форма из пункта "Пример формы" - она же первый шаблон библиотеки
+EXAMPLE_FORM = """Форма подачи:
+
+1. Ваш игровой Никнейм:
+2. Ваш игровой уровень:
+3. Скриншот статистики аккаунта(/time):
+4. Были ли баны/варны(если да, то за что):
+5. Как вы считаете, почему именно вы должны занять пост старшего состава:
+6. Были ли ранее на руководящей должности:
+7. Ссылка на одобренную РП биографию (обязательна для занятия должности заместителя организации):
+8. Ваш часовой пояс:
+9. Ссылка на страницу ВК:
+10. Логин Discord:
+11. Ваше реальное имя:
+12. Ваш реальный возраст:"""
+
+# Шаблоны, которые есть в библиотеке с самого начала: имя -> текст формы
+BUILTIN_TEMPLATES = {
+    "Старший состав (пример)": EXAMPLE_FORM,
+}
+
+
+class TemplateLibrary:
+    """Библиотека готовых шаблонов форм
+    
+    Шаблоны хранятся уже разобранными (заголовок, вопросы и типы полей) в
+    одном файле формата marshal, который загружается быстрее JSON и не требует
+    ни разбора, ни классификации. Вместе с разобранными вопросами хранится
+    исходный текст, поэтому при смене правил разбора (ParseCache.VERSION)
+    библиотека пересобирается сама.
+    """
+    
+    FORMAT = 1
+    
+    def __init__(self, path, parse):
+        self.path = path
+        self.parse = parse  # строки формы -> (заголовок, вопросы)
+        self._templates = None
+    
+    def templates(self):
+        """Словарь имя -> (заголовок, вопросы в виде кортежей, текст формы)"""
+        if self._templates is not None:
+            return self._templates
+        
+        import marshal
+        
+        try:
+            with open(self.path, 'rb') as f:
+                header, version, templates = marshal.load(f)
+            if header != self.FORMAT:
+                raise ValueError("другой формат библиотеки")
+        except (OSError, EOFError, ValueError, TypeError):
+            version, templates = None, {}
+        
+        sources = {name: text for name, text in BUILTIN_TEMPLATES.items() if name not in templates}
+        if version != ParseCache.VERSION:
+            # Правила разбора поменялись - пересобираем все шаблоны из текста
+            sources.update((name, template[2]) for name, template in templates.items())
+        
+        self._templates = templates
+        if sources:
+            for name, text in sources.items():
+                self._templates[name] = self.compile(text)
+            self.write()
+        return self._templates
+    
+    def compile(self, text):
+        """Разбор текста формы в запись библиотеки"""
+        title, questions = self.parse(text.split('\n'))
+        return (title, tuple((q.number, q.original, q.clean, q.type) for q in questions), text)
+    
+    def write(self):
+        import marshal
+        
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            marshal.dump((self.FORMAT, ParseCache.VERSION, self._templates), f)
+        os.replace(tmp_path, self.path)
+    
+    def names(self):
+        return list(self.templates())
+    
+    def load(self, name):
+        """(заголовок, новые записи Question) шаблона или None"""
+        template = self.templates().get(name)
+        if template is None:
+            return None
+        title, questions, _ = template
+        return title, [Question(*question) for question in questions]
+    
+    def add(self, name, text):
+        """Добавление (или замена) шаблона; возвращает количество вопросов"""
+        template = self.compile(text)
+        if not template[1]:
+            return 0
+        self.templates()[name] = template
+        self.write()
+        return len(template[1])
+    
+    def remove(self, name):
+        if self.templates().pop(name, None) is None:
+            return False
+        self.write()
+        return True
+
+
+# Алгоритмы хэша BB-кода: имя -> (конструктор в hashlib, параметры).
+# Хэш нужен только для поиска повторов; md5 - режим совместимости с уже
+# сохраненными формами, у остальных перед хэшем пишется имя ("blake2b:...").
+HASH_ALGORITHMS = {
+    "md5": ("md5", {}),
+    "blake2b": ("blake2b", {"digest_size": 16}),
+    "sha256": ("sha256", {}),
+}
+DEFAULT_HASH = "md5"
+
+
+def new_hasher(algorithm=DEFAULT_HASH):
+    """Пустой объект хэша для алгоритма из HASH_ALGORITHMS"""
+    import hashlib
+    name, options = HASH_ALGORITHMS[algorithm]
+    return getattr(hashlib, name)(**options)
+
+
+def format_hash(algorithm, hasher):
+    """Строка хэша в том виде, в каком она сохраняется (bbcode_hash)"""
+    if algorithm == "md5":
+        return hasher.hexdigest()
+    return f"{algorithm}:{hasher.hexdigest()}"
+
+
+def hash_text(text, algorithm=DEFAULT_HASH):
+    """Хэш текста целиком"""
+    hasher = new_hasher(algorithm)
+    hasher.update(text.encode('utf-8'))
+    return format_hash(algorithm, hasher)
+
+
+def hash_algorithm(bbcode_hash):
+    """Алгоритм, которым посчитан сохраненный bbcode_hash"""
+    algorithm, separator, _ = bbcode_hash.partition(":")
+    return algorithm if separator else "md5"
+
+
+def stored_hash_algorithms(connection):
+    """Алгоритмы хэшей, записанные в таблицу meta базы SQLite
+    
+    Базы без такой отметки появились до --hash, и в них только md5.
+    """
+    row = connection.execute("SELECT value FROM meta WHERE key = 'hash_algorithms'").fetchone()
+    return set(row[0].split(",")) if row else {DEFAULT_HASH}
+
+
+def note_hash_algorithm(connection, bbcode_hash):
+    """Отметка в meta, что в базе есть хэш такого алгоритма (внутри транзакции)"""
+    algorithms = stored_hash_algorithms(connection)
+    algorithm = hash_algorithm(bbcode_hash)
+    if algorithm not in algorithms:
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('hash_algorithms', ?)",
+                           (",".join(sorted(algorithms | {algorithm})),))
+
+
+# Текст ссылки по категории вопроса (FIELD_CLASSIFIER); иначе "Ссылка"
+LINK_LABELS = {
+    "label_vk": "Профиль ВК",
+    "label_discord": "Discord",
+    "label_biography": "Биография",
+}
+
+# Что выводится вместо пустого ответа
+MISSING_ANSWERS = {
+    "screenshot": "(скриншот не загружен)",
+    "link": "(ссылка не указана)",
+    "multiline": "(не заполнено)",
+}
+
+
+def row_model(number, question, answer, field_type):
+    """Строка формы без оформления: (номер, вопрос с двоеточием, вид, значение, подпись)
+    
+    Вид ответа:
+    - "text" - значение выводится как есть;
+    - "link" - значение - адрес, подпись - текст ссылки;
+    - "lines" - кортеж непустых строк многострочного ответа;
+    - "missing" - ответа нет, значение - текст-заглушка.
+    
+    Из одной и той же модели строка выводится в HTML и Markdown (render_formats).
+    """
+    question_text = question if question[-1:] == ":" else question + ":"
+    if field_type not in MISSING_ANSWERS:
+        return number, question_text, "text", answer, None
+    if not answer:
+        return number, question_text, "missing", MISSING_ANSWERS[field_type], None
+    if field_type == "screenshot":
+        return number, question_text, "link", answer, "Скриншот"
+    if field_type == "link":
+        categories = FIELD_CLASSIFIER.classify(question)
+        label = next((text for category, text in LINK_LABELS.items() if category in categories), "Ссылка")
+        return number, question_text, "link", answer, label
+    return number, question_text, "lines", tuple(line.strip() for line in answer.split('\n') if line.strip()), None
+
+
+class DesignPlan:
+    """Кэш планов отрисовки: план собирается один раз на набор цветов дизайна"""
+    
+    _cache = {}
+    
+    @classmethod
+    def for_design(cls, design):
+        """План для дизайна (из кэша, если такие цвета уже встречались)"""
+        key = (design["header"], design["question"], design["answer"], design["link"])
+        plan = cls._cache.get(key)
+        if plan is None:
+            plan = cls._cache[key] = cls(*key)
+        return plan
+
+
+class RenderPlan(DesignPlan):
+    """Заранее собранные фрагменты BB-кода для одного дизайна
+    
+    Все теги с цветами дизайна собираются один раз, а строки таблицы
+    выводятся функцией, выбранной по типу поля. Планы кэшируются по
+    набору цветов, поэтому пользовательские дизайны тоже переиспользуются.
+    """
+    
+    _cache = {}
+    
+    def __init__(self, header, question, answer, link):
+        # Шапка и подвал формы
+        self.head = f"[center][font=Courier New]\n[size=11][b][color={header}]┌────────────────────┐[/color]\n"
+        self.table_open = f"\n[color={header}]└────────────────────┘[/color][/b][/size]\n\n[size=9]\n[table]\n"
+        self.tail = "\n[/table]\n[/size]\n[/font][/center]"
+        self.tail_bytes = self.tail.encode('utf-8')
+        
+        # Строка таблицы: ячейка вопроса и закрытие строки
+        self.question_open = f"[tr][td][color={question}][b]ВОПРОС "
+        self.question_close = "[/b][/color][/td][td]"
+        self.row_close = "[/td][/tr]"
+        self.question_cells = {}
+        self.row_cache = {}
+        # Готовые строки render_formats: набор форматов -> {поля строки: строки}
+        self.format_rows = {}
+        
+        # Ответы
+        self.answer_open = f"[color={answer}]"
+        self.text_row_close = "[/color][/td][/tr]"
+        self.answer_line_break = f"[/color]\n[color={answer}]"
+        self.link_open = f"[color={link}][url="
+        self.screenshot_close = "]Скриншот[/url][/color]"
+        self.link_labels = {category: f"]{text}[/url][/color]" for category, text in LINK_LABELS.items()}
+        self.link_close = "]Ссылка[/url][/color]"
+        self.no_screenshot = f"[color={answer}]{MISSING_ANSWERS['screenshot']}[/color]"
+        self.no_link = f"[color={answer}]{MISSING_ANSWERS['link']}[/color]"
+        self.no_answer = f"[color={answer}]{MISSING_ANSWERS['multiline']}[/color]"
+        
+        # Обычный текст (и неизвестные типы) выводится без вызова функции
+        self.emitters = {
+            "screenshot": self.screenshot_answer,
+            "link": self.link_answer,
+            "multiline": self.multiline_answer,
+        }
+    
+    def question_cell(self, number, question):
+        """Начало строки таблицы вплоть до ячейки ответа (кэшируется)"""
+        cell = self.question_cells.get((number, question))
+        if cell is None:
+            question_text = question if question.endswith(":") else question + ":"
+            cell = f"{self.question_open}{number}. {question_text}{self.question_close}"
+            if len(self.question_cells) >= 65536:
+                self.question_cells.clear()
+            self.question_cells[(number, question)] = cell
+        return cell
+    
+    def screenshot_answer(self, question, answer):
+        if not answer:
+            return self.no_screenshot
+        return self.link_open + answer + self.screenshot_close
+    
+    def link_answer(self, question, answer):
+        if not answer:
+            return self.no_link
+        # Текст ссылки зависит от вопроса (ВК, Discord, биография)
+        categories = FIELD_CLASSIFIER.classify(question)
+        for label, close in self.link_labels.items():
+            if label in categories:
+                return self.link_open + answer + close
+        return self.link_open + answer + self.link_close
+    
+    def multiline_answer(self, question, answer):
+        if not answer:
+            return self.no_answer
+        lines = [line.strip() for line in answer.split('\n') if line.strip()]
+        if not lines:
+            return ""
+        return self.answer_open + self.answer_line_break.join(lines) + "[/color]"
+    
+    def render_row(self, number, question, answer, field_type):
+        """Одна строка таблицы"""
+        cell = self.question_cell(number, question)
+        emit = self.emitters.get(field_type)
+        if emit is None:
+            return cell + self.answer_open + answer + self.text_row_close
+        return cell + emit(question, answer) + self.row_close
+    
+    def render_incremental(self, title, filled_questions, algorithm=DEFAULT_HASH):
+        """BB-код и его хэш, который считается по ходу отрисовки строк
+        
+        Строки кэшируются по (номер, вопрос, ответ, тип) вместе с их байтами
+        в UTF-8, поэтому хэш считается по уже готовым байтам строк, без
+        кодирования всего текста. Хэш тот же, что hash_text(bbcode, algorithm).
+        После правки одного ответа заново отрисовывается только эта строка.
+        Когда старых строк в кэше становится заметно больше, чем в текущей
+        форме, в нем остаются только строки последней отрисовки, поэтому
+        законченные формы не копятся в памяти.
+        """
+        row_cache = self.row_cache
+        rows = []
+        encoded = []
+        opening = "".join((self.head, title.upper(), self.table_open))
+        
+        for key in iter_row_fields(filled_questions):
+            entry = row_cache.get(key)
+            if entry is None:
+                row = self.render_row(*key)
+                entry = (row, row.encode('utf-8'))
+                row_cache[key] = entry
+            rows.append(entry[0])
+            encoded.append(entry[1])
+        
+        if len(row_cache) > 2 * len(rows) + 64:
+            self.row_cache = {key: row_cache[key] for key in iter_row_fields(filled_questions)}
+        
+        # Байты строк уже готовы, поэтому хэш - одно обновление без кодирования
+        digest = new_hasher(algorithm)
+        digest.update(opening.encode('utf-8'))
+        digest.update(b"\n".join(encoded))
+        digest.update(self.tail_bytes)
+        
+        bbcode = "".join((opening, "\n".join(rows), self.tail))
+        return bbcode, format_hash(algorithm, digest)
+    
+    def render(self, title, filled_questions):
+        """Полный BB-код формы"""
+        cells = self.question_cells
+        question_cell = self.question_cell
+        emitters = self.emitters
+        answer_open = self.answer_open
+        text_row_close = self.text_row_close
+        row_close = self.row_close
+        
+        rows = []
+        append = rows.append
+        for q in filled_questions:
+            # То же, что iter_row_fields, но без генератора - это самый горячий цикл
+            if q.__class__ is Question:
+                number, question, answer, field_type = q.number, q.clean, q.answer, q.type
+            else:
+                number, question, answer, field_type = q["number"], q["question"], q["answer"], q["type"]
+            cell = cells.get((number, question)) or question_cell(number, question)
+            emit = emitters.get(field_type)
+            if emit is None:
+                append(cell + answer_open + answer + text_row_close)
+            else:
+                append(cell + emit(question, answer) + row_close)
+        
+        return self.document(title, rows)
+    
+    def document(self, title, rows):
+        return "".join((self.head, title.upper(), self.table_open, "\n".join(rows), self.tail))
+
+
+class HtmlPlan(DesignPlan):
+    """Та же форма в HTML для сайта: таблица с цветами дизайна
+    
+    Текст ответов экранируется, а ссылками становятся только адреса
+    http(s) - остальное выводится как обычный текст.
+    """
+    
+    _cache = {}
+    
+    def __init__(self, header, question, answer, link):
+        import html
+        self.escape = html.escape
+        header, question, answer, link = (html.escape(color) for color in (header, question, answer, link))
+        
+        self.head = ('<div style="text-align: center; font-family: \'Courier New\', monospace">\n'
+                     f'<div style="font-size: 11pt; font-weight: bold"><span style="color: {header}">'
+                     '┌────────────────────┐</span><br>\n')
+        self.table_open = (f'<br>\n<span style="color: {header}">└────────────────────┘</span></div>\n'
+                           '<table style="font-size: 9pt; margin: 0 auto">\n')
+        self.tail = "\n</table>\n</div>"
+        
+        self.question_open = f'<tr><td style="color: {question}"><b>ВОПРОС '
+        self.question_close = "</b></td><td>"
+        self.row_close = "</td></tr>"
+        self.question_cells = {}
+        self.format_rows = {}
+        
+        self.answer_open = f'<span style="color: {answer}">'
+        self.link_open = f'<a style="color: {link}" href="'
+    
+    def model_row(self, row):
+        number, question, kind, value, label = row
+        escape = self.escape
+        cell = self.question_cells.get((number, question))
+        if cell is None:
+            cell = f"{self.question_open}{number}. {escape(question)}{self.question_close}"
+            if len(self.question_cells) >= 65536:
+                self.question_cells.clear()
+            self.question_cells[(number, question)] = cell
+        
+        if kind == "link" and value.lower().startswith(("http://", "https://")):
+            return f'{cell}{self.link_open}{escape(value)}">{escape(label)}</a>{self.row_close}'
+        if kind == "lines":
+            if not value:
+                return cell + self.row_close
+            return cell + self.answer_open + "<br>".join(map(escape, value)) + "</span>" + self.row_close
+        return cell + self.answer_open + escape(value) + "</span>" + self.row_close
+    
+    def document(self, title, rows):
+        return "".join((self.head, self.escape(title.upper()), self.table_open, "\n".join(rows), self.tail))
+
+
+# Символы разметки Markdown, которые в ответах нужно экранировать
+MARKDOWN_SPECIAL_RE = re.compile(r'([\\`*_~|>\[\]#])')
+
+
+class MarkdownPlan(DesignPlan):
+    """Та же форма в Markdown для Discord
+    
+    Таблиц и цветов в Discord нет, поэтому вопросы выводятся жирным,
+    а ответ - следующей строкой. Цвета дизайна не используются.
+    """
+    
+    _cache = {}
+    
+    def __init__(self, header, question, answer, link):
+        self.question_cells = {}
+        self.format_rows = {}
+    
+    @staticmethod
+    def escape(text, search=MARKDOWN_SPECIAL_RE.search, sub=MARKDOWN_SPECIAL_RE.sub):
+        # В большинстве ответов разметки нет - тогда замена не запускается
+        return sub(r'\\\1', text) if search(text) else text
+    
+    def model_row(self, row):
+        number, question, kind, value, label = row
+        escape = self.escape
+        cell = self.question_cells.get((number, question))
+        if cell is None:
+            cell = f"**ВОПРОС {number}. {escape(question)}**\n"
+            if len(self.question_cells) >= 65536:
+                self.question_cells.clear()
+            self.question_cells[(number, question)] = cell
+        
+        if kind == "link" and value.lower().startswith(("http://", "https://")):
+            # Угловые скобки - чтобы скобки в адресе не обрывали ссылку
+            return f"{cell}[{label}](<{value.replace('>', '%3E')}>)"
+        if kind == "lines":
+            return cell + "\n".join(map(escape, value))
+        if kind == "missing":
+            return f"{cell}*{value}*"
+        return cell + escape(value)
+    
+    def document(self, title, rows):
+        return f"## {self.escape(title.upper())}\n\n" + "\n\n".join(rows) + "\n"
+
+
+# Форматы вывода формы: имя -> план отрисовки
+EXPORT_FORMATS = {
+    "bbcode": RenderPlan,
+    "html": HtmlPlan,
+    "markdown": MarkdownPlan,
+}
+
+
+def render_formats(title, filled_questions, design, formats=("bbcode",)):
+    """Форма сразу в нескольких форматах за один проход по вопросам
+    
+    Готовые строки всех форматов кэшируются вместе по (номер, вопрос,
+    ответ, тип), поэтому повторная отрисовка формы (другой формат вывода,
+    правка одного ответа) берет неизменные строки из кэша одним поиском.
+    Новая строка BB-кода выводится теми же функциями, что и в generate_bbcode
+    (RenderPlan.render_row), а для HTML и Markdown один раз считается модель
+    строки (row_model) с видом ответа и подписью ссылки. У плана каждого
+    формата есть document(заголовок, строки) -> текст.
+    Возвращает словарь формат -> готовый текст.
+    """
+    formats = tuple(formats)
+    plans = [EXPORT_FORMATS[name].for_design(design) for name in formats]
+    # BB-код - по полям строки, остальные форматы - по ее модели
+    makers = [(plan.render_row, True) if plan.__class__ is RenderPlan else (plan.model_row, False)
+              for plan in plans]
+    modeled = not all(by_fields for _, by_fields in makers)
+    cache = plans[0].format_rows.setdefault(formats, {})
+    get = cache.get
+    
+    rows = []
+    append = rows.append
+    for q in filled_questions:
+        # То же, что iter_row_fields, но без генератора (как в RenderPlan.render)
+        if q.__class__ is Question:
+            fields = (q.number, q.clean, q.answer, q.type)
+        else:
+            fields = (q["number"], q["question"], q["answer"], q["type"])
+        row = get(fields)
+        if row is None:
+            model = row_model(*fields) if modeled else None
+            row = tuple([make(*fields) if by_fields else make(model) for make, by_fields in makers])
+            if len(cache) >= 65536:
+                cache.clear()
+            cache[fields] = row
+        append(row)
+    
+    columns = zip(*rows) if rows else [()] * len(plans)
+    return {name: plan.document(title, list(column)) for name, plan, column in zip(formats, plans, columns)}
+
+
+# Тег BB-кода: [имя], [имя=значение] или [/имя]
+BB_TAG_RE = re.compile(r'\[(/?)([a-zA-Z]+)(?:=([^\]]*))?\]')
+
+# Теги оформления текста: их можно объединять и убирать; остальные теги
+# (таблица, ячейки, ссылки, размер) разделяют участки текста
+INLINE_TAGS = {"color", "b", "i", "u", "s"}
+
+
+def minify_bbcode(bbcode):
+    """BB-код без лишних тегов при том же виде на форуме
+    
+    - соседние участки одного цвета, между которыми только пробелы и переводы
+      строк, объединяются в один тег [color] (так пишутся многострочные ответы);
+    - [color] внутри такого же цвета и пустые теги оформления убираются.
+    
+    Если теги в тексте не сбалансированы (например, в ответе есть свой
+    незакрытый тег), BB-код возвращается без изменений.
+    """
+    out = []
+    stack = []  # открытые теги: (имя, значение, индекс тега в out или None - тег убран)
+    last_close = None  # (индекс [/color] в out, цвет, глубина стека), если после него только пробелы
+    position = 0
+    
+    for match in BB_TAG_RE.finditer(bbcode):
+        text = bbcode[position:match.start()]
+        position = match.end()
+        if text:
+            out.append(text)
+            if not text.isspace():
+                last_close = None
+        
+        closing, name, value = match.group(1), match.group(2).lower(), match.group(3)
+        value = value.strip().lower() if value is not None else None
+        
+        if not closing:
+            if name == "color":
+                if last_close is not None and last_close[1] == value and last_close[2] == len(stack):
+                    # [/color] + пробелы + [color] того же цвета - продолжаем прежний участок
+                    out[last_close[0]] = ""
+                    stack.append((name, value, last_close[0]))
+                    last_close = None
+                    continue
+                
+                # Ближайший внешний цвет (в пределах ячейки) такой же - тег не нужен
+                for outer_name, outer_value, _ in reversed(stack):
+                    if outer_name not in INLINE_TAGS:
+                        break
+                    if outer_name == "color":
+                        if outer_value == value:
+                            stack.append((name, value, None))
+                            value = None
+                        break
+                if value is None:
+                    continue
+            
+            out.append(match.group(0))
+            stack.append((name, value, len(out) - 1))
+            last_close = None
+            continue
+        
+        if not stack or stack[-1][0] != name:
+            return bbcode
+        _, open_value, open_index = stack.pop()
+        if open_index is None:
+            continue
+        if name in INLINE_TAGS and open_index == len(out) - 1:
+            if out[open_index] == "":
+                # Продолжение участка оказалось пустым - возвращаем прежний [/color]
+                out[open_index] = match.group(0)
+                last_close = (open_index, open_value, len(stack))
+                continue
+            # Пустой тег оформления
+            out.pop()
+            continue
+        
+        out.append(match.group(0))
+        last_close = (len(out) - 1, open_value, len(stack)) if name == "color" else None
+    
+    if stack:
+        return bbcode
+    out.append(bbcode[position:])
+    return "".join(out)
+
+
+def split_bbcode(bbcode, limit, measure=len):
+    """Деление BB-кода формы на посты не длиннее limit
+    
+    Строки таблицы ([tr]...[/tr]) раскладываются по постам по порядку за
+    один проход: пост заполняется, пока следующая строка помещается. Шапка
+    формы остается только в первом посте, а в остальных таблица открывается
+    заново теми же тегами ([center][font][size][table]) и закрывается так же,
+    как в исходном BB-коде. measure - длина текста (len - символы, для байт
+    нужна длина в UTF-8). Если не помещается даже одна строка - ValueError.
+    """
+    if measure(bbcode) <= limit:
+        return [bbcode]
+    
+    table = BB_TAG_RE.search(bbcode)
+    opened = []  # открытые теги перед таблицей: (тег, пробелы после него)
+    while table is not None:
+        if table.group(1):
+            if opened:
+                opened.pop()
+        else:
+            following = bbcode[table.end():table.end() + 16]
+            spacing = following[:len(following) - len(following.lstrip())]
+            opened.append(table.group(0) + spacing)
+            if table.group(2).lower() == "table":
+                break
+        table = BB_TAG_RE.search(bbcode, table.end())
+    rows_end = bbcode.rfind("[/tr]")
+    if table is None or rows_end == -1:
+        raise ValueError("В BB-коде нет таблицы, делить на посты нечего")
+    
+    rows_start = table.end() + len(spacing)
+    rows_end += len("[/tr]")
+    head = bbcode[:rows_start]
+    reopen = "".join(opened)
+    tail = bbcode[rows_end:]
+    # Ответы бывают многострочными, поэтому строки таблицы делятся по [/tr]
+    rows = [row + "[/tr]" for row in bbcode[rows_start:rows_end - len("[/tr]")].split("[/tr]\n")]
+    
+    posts = []
+    post_rows = []
+    separator = measure("\n")
+    tail_size = measure(tail)
+    size = measure(head) + tail_size
+    for number, row in enumerate(rows, 1):
+        row_size = measure(row) + (separator if post_rows else 0)
+        if post_rows and size + row_size > limit:
+            posts.append("\n".join(post_rows))
+            post_rows = []
+            size = measure(reopen) + tail_size
+            row_size -= separator
+        if size + row_size > limit:
+            raise ValueError(f"Строка {number} таблицы не помещается в пост длиной {limit}")
+        post_rows.append(row)
+        size += row_size
+    posts.append("\n".join(post_rows))
+    
+    return [(head if index == 0 else reopen) + rows_text + tail for index, rows_text in enumerate(posts)]
+
+
+def utf8_length(text):
+    """Длина текста в байтах UTF-8"""
+    return len(text.encode('utf-8'))
+
+
+class HashIndex:
+    """Индекс хэшей сохраненных BB-кодов для быстрой проверки дубликатов
+    
+    Хранится в SQLite рядом с сохраненными формами. Проверка и запись хэша
+    выполняются одной транзакцией, поэтому два одновременных сохранения
+    не могут записать один и тот же BB-код дважды.
+    """
+    
+    FILE_NAME = "hash_index.sqlite3"
+    
+    def __init__(self, folder, stats=NULL_STATS):
+        self.folder = folder
+        self.path = os.path.join(folder, self.FILE_NAME)
+        self.stats = stats
+        self._connection = None
+    
+    def connect(self):
+        """Открытие индекса (при первом запуске индекс строится по папке)"""
+        if self._connection is not None:
+            return self._connection
+        
+        import sqlite3
+        
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute("CREATE TABLE IF NOT EXISTS hashes (hash TEXT PRIMARY KEY, file TEXT NOT NULL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._connection = connection
+        
+        # Папка могла появиться раньше индекса - заполняем его один раз
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            built = connection.execute("SELECT value FROM meta WHERE key = 'built'").fetchone()
+            if not built:
+                self._fill_from_folder(connection)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        
+        return connection
+    
+    def _fill_from_folder(self, connection):
+        """Заполнение индекса хэшами из .json файлов папки"""
+        import json
+        
+        count = 0
+        algorithms = {DEFAULT_HASH}
+        for file_name in os.listdir(self.folder):
+            if not file_name.endswith('.json'):
+                continue
+            self.stats.count("index.files_scanned")
+            try:
+                with open(os.path.join(self.folder, file_name), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception:
+                continue
+            if data.get('bbcode_hash'):
+                connection.execute("INSERT OR IGNORE INTO hashes (hash, file) VALUES (?, ?)",
+                                   (data['bbcode_hash'], file_name))
+                algorithms.add(hash_algorithm(data['bbcode_hash']))
+                count += 1
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built', ?)",
+                           (datetime.datetime.now().isoformat(),))
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('hash_algorithms', ?)",
+                           (",".join(sorted(algorithms)),))
+        return count
+    
+    def rebuild(self):
+        """Полное перестроение индекса по содержимому папки"""
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM hashes")
+            count = self._fill_from_folder(connection)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return count
+    
+    def find(self, bbcode_hash):
+        """Имя файла с таким хэшем или None"""
+        row = self.connect().execute("SELECT file FROM hashes WHERE hash = ?", (bbcode_hash,)).fetchone()
+        return row[0] if row else None
+    
+    def hash_algorithms(self):
+        """Алгоритмы, которыми посчитаны хэши в индексе"""
+        return stored_hash_algorithms(self.connect())
+    
+    def claim(self, bbcode_hash, file_name):
+        """Атомарная регистрация хэша
+        
+        Возвращает None, если хэш записан за file_name, или имя файла,
+        за которым этот хэш уже числится. Если файл из индекса удалили,
+        хэш переходит к file_name, как будто такой формы и не было.
+        """
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT file FROM hashes WHERE hash = ?", (bbcode_hash,)).fetchone()
+            if row is None:
+                connection.execute("INSERT INTO hashes (hash, file) VALUES (?, ?)", (bbcode_hash, file_name))
+                note_hash_algorithm(connection, bbcode_hash)
+            elif row[0] != file_name and not os.path.exists(os.path.join(self.folder, row[0])):
+                connection.execute("UPDATE hashes SET file = ? WHERE hash = ?", (file_name, bbcode_hash))
+                self.stats.count("index.stale_entries")
+                row = None
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return row[0] if row else None
+    
+    def release(self, bbcode_hash, file_name):
+        """Снятие регистрации, если файл так и не был записан"""
+        self.connect().execute("DELETE FROM hashes WHERE hash = ? AND file = ?", (bbcode_hash, file_name))
+    
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class FolderStorage:
+    """Хранение форм парами файлов .txt (BB-код) + .json (данные) в одной папке"""
+    
+    def __init__(self, folder, hash_index, stats=NULL_STATS):
+        self.folder = folder
+        self.hash_index = hash_index
+        self.stats = stats
+    
+    def describe(self):
+        return f"📁 Файлы сохранены в папку: {os.path.abspath(self.folder)}"
+    
+    def find(self, bbcode_hash):
+        """Имя .json файла с таким хэшем или None (в том числе если файл удален)"""
+        file_name = self.hash_index.find(bbcode_hash)
+        if file_name is None or not os.path.exists(os.path.join(self.folder, file_name)):
+            return None
+        return file_name
+    
+    def hash_algorithms(self):
+        """Алгоритмы, которыми посчитаны хэши сохраненных форм"""
+        return self.hash_index.hash_algorithms()
+    
+    def save(self, record, name):
+        """Сохранение записи формы
+        
+        Возвращает (True, [(подпись, путь), ...]) или (False, где уже сохранен
+        такой же BB-код).
+        """
+        import json
+        
+        # Гарантируем, что папка существует
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        
+        bbcode_file = os.path.join(self.folder, f"{name}.txt")
+        data_file = os.path.join(self.folder, f"{name}.json")
+        
+        # Проверяем по индексу, был ли уже сохранен такой же BB-код,
+        # и сразу закрепляем хэш за новым файлом
+        existing_file = self.hash_index.claim(record["bbcode_hash"], os.path.basename(data_file))
+        if existing_file:
+            return False, existing_file
+        
+        try:
+            # Сохраняем BB-код
+            with open(bbcode_file, 'w', encoding='utf-8') as f:
+                f.write(record["bbcode"])
+            
+            # Сохраняем данные
+            with open(data_file, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False, indent=2)
+        except BaseException:
+            # В том числе Ctrl+C посреди записи - иначе хэш остался бы за файлом,
+            # которого нет
+            self.hash_index.release(record["bbcode_hash"], os.path.basename(data_file))
+            raise
+        
+        if self.stats.enabled:
+            self.stats.count("save.files_written", 2)
+            self.stats.count("save.bytes_written", os.path.getsize(bbcode_file) + os.path.getsize(data_file))
+        
+        return True, [("📄 BB-код", bbcode_file), ("📊 Данные", data_file)]
+    
+    def save_many(self, records):
+        """Сохранение пачки пар (запись, имя); возвращает количество новых"""
+        return sum(1 for record, name in records if self.save(record, name)[0])
+    
+    def replace(self, old_hash, record, name):
+        """Замена записи с хэшем old_hash новой версией формы
+        
+        Файлы сохраняют прежнее имя. False - записи с old_hash нет или
+        такой BB-код уже сохранен в другом файле.
+        """
+        file_name = self.hash_index.find(old_hash)
+        if file_name is None or self.hash_index.find(record["bbcode_hash"]) not in (None, file_name):
+            return False
+        return self.update_many([(file_name, old_hash, record)]) == 1
+    
+    def update_many(self, updates):
+        """Замена записей (имя .json файла, старый хэш, новая запись)
+        
+        Файлы перезаписываются через временный файл, поэтому прерванная
+        замена не оставляет обрезанных файлов. Возвращает количество
+        замененных (запись не меняется, если такой же BB-код уже сохранен
+        в другом файле).
+        """
+        import json
+        
+        updated = 0
+        for file_name, old_hash, record in updates:
+            new_hash = record["bbcode_hash"]
+            owner = self.hash_index.claim(new_hash, file_name)
+            if owner not in (None, file_name):
+                continue
+            
+            data_file = os.path.join(self.folder, file_name)
+            bbcode_file = data_file[:-len('.json')] + ".txt"
+            try:
+                for path, write in ((bbcode_file, lambda f: f.write(record["bbcode"])),
+                                    (data_file, lambda f: json.dump(record, f, ensure_ascii=False, indent=2))):
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        write(f)
+                    os.replace(tmp_path, path)
+            except BaseException:
+                if owner is None:
+                    self.hash_index.release(new_hash, file_name)
+                raise
+            
+            if old_hash != new_hash:
+                self.hash_index.release(old_hash, file_name)
+            updated += 1
+            
+            if self.stats.enabled:
+                self.stats.count("save.files_written", 2)
+        return updated
+    
+    def iter_records(self):
+        """Все сохраненные записи: (имя .json файла, данные)"""
+        import json
+        
+        if not os.path.exists(self.folder):
+            return
+        for file_name in sorted(os.listdir(self.folder)):
+            if not file_name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.folder, file_name), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception:
+                continue
+            if isinstance(data, dict) and "bbcode" in data:
+                yield file_name, data
+
+
+class SqliteStorage:
+    """Хранение форм в базе SQLite
+    
+    Формы и ответы лежат в отдельных таблицах с индексами по хэшу, заголовку
+    и дате, база работает в режиме WAL. Несколько записей можно сохранить
+    одной транзакцией через save_many().
+    """
+    
+    FILE_NAME = "forms.sqlite3"
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS forms (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            title TEXT NOT NULL,
+            design TEXT NOT NULL,
+            bbcode TEXT NOT NULL,
+            bbcode_hash TEXT NOT NULL UNIQUE,
+            generated TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS answers (
+            form_id INTEGER NOT NULL REFERENCES forms(id) ON DELETE CASCADE,
+            number INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            original TEXT NOT NULL,
+            answer TEXT,
+            type TEXT NOT NULL,
+            PRIMARY KEY (form_id, number)
+        );
+        CREATE INDEX IF NOT EXISTS forms_title ON forms(title);
+        CREATE INDEX IF NOT EXISTS forms_generated ON forms(generated);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+    
+    def __init__(self, path, stats=NULL_STATS):
+        self.path = path
+        self.stats = stats
+        self._connection = None
+    
+    def describe(self):
+        return f"🗄️  База данных: {os.path.abspath(self.path)}"
+    
+    def connect(self):
+        if self._connection is not None:
+            return self._connection
+        
+        import sqlite3
+        
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        connection.executescript(self.SCHEMA)
+        self._connection = connection
+        return connection
+    
+    def _insert(self, connection, record, name):
+        """Вставка одной записи внутри открытой транзакции (None - дубликат)"""
+        import json
+        
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO forms (name, title, design, bbcode, bbcode_hash, generated) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (name, record["title"], json.dumps(record["design"], ensure_ascii=False),
+             record["bbcode"], record["bbcode_hash"], record["generated"]))
+        if not cursor.rowcount:
+            return None
+        
+        form_id = cursor.lastrowid
+        self._insert_answers(connection, form_id, record["questions"])
+        note_hash_algorithm(connection, record["bbcode_hash"])
+        
+        if self.stats.enabled:
+            self.stats.count("save.rows_written", 1 + len(record["questions"]))
+            self.stats.count("save.bytes_written", len(record["bbcode"].encode('utf-8')))
+        return form_id
+    
+    def _insert_answers(self, connection, form_id, questions):
+        connection.executemany(
+            "INSERT INTO answers (form_id, number, question, original, answer, type) VALUES (?, ?, ?, ?, ?, ?)",
+            [(form_id, q["number"], q.get("question", q.get("clean")), q["original"], q.get("answer"), q["type"])
+             for q in questions])
+    
+    def save(self, record, name):
+        """Сохранение записи формы (формат результата как у FolderStorage.save)"""
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            form_id = self._insert(connection, record, name)
+            if form_id is None:
+                existing = self.find(record["bbcode_hash"])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        
+        if form_id is None:
+            return False, existing
+        return True, [("🗄️  Запись", f"{self.path} #{form_id}")]
+    
+    def find(self, bbcode_hash):
+        """Где сохранена запись с таким хэшем (для сообщения) или None"""
+        row = self.connect().execute("SELECT id, name FROM forms WHERE bbcode_hash = ?",
+                                     (bbcode_hash,)).fetchone()
+        return f"{self.path} (запись #{row[0]}, {row[1]})" if row else None
+    
+    def hash_algorithms(self):
+        """Алгоритмы, которыми посчитаны хэши сохраненных форм"""
+        return stored_hash_algorithms(self.connect())
+    
+    def save_many(self, records):
+        """Сохранение пачки записей одной транзакцией
+        
+        records - пары (запись, имя). Возвращает количество новых записей
+        (дубликаты по хэшу пропускаются).
+        """
+        connection = self.connect()
+        saved = 0
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for record, name in records:
+                if self._insert(connection, record, name) is not None:
+                    saved += 1
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return saved
+    
+    def replace(self, old_hash, record, name):
+        """Замена записи с хэшем old_hash новой версией формы вместе с ответами
+        
+        False - записи с old_hash нет или такой BB-код уже есть в другой записи.
+        """
+        import json
+        
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT id FROM forms WHERE bbcode_hash = ?", (old_hash,)).fetchone()
+            replaced = False
+            if row is not None:
+                cursor = connection.execute(
+                    "UPDATE OR IGNORE forms SET design = ?, bbcode = ?, bbcode_hash = ?, generated = ? WHERE id = ?",
+                    (json.dumps(record["design"], ensure_ascii=False), record["bbcode"], record["bbcode_hash"],
+                     record["generated"], row[0]))
+                replaced = cursor.rowcount == 1
+            if replaced:
+                connection.execute("DELETE FROM answers WHERE form_id = ?", (row[0],))
+                self._insert_answers(connection, row[0], record["questions"])
+                note_hash_algorithm(connection, record["bbcode_hash"])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return replaced
+    
+    def update_many(self, updates):
+        """Замена записей (номер записи, старый хэш, новая запись) одной транзакцией
+        
+        Возвращает количество замененных (запись не меняется, если такой
+        же BB-код уже есть в другой записи).
+        """
+        import json
+        
+        connection = self.connect()
+        updated = 0
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for form_id, old_hash, record in updates:
+                cursor = connection.execute(
+                    "UPDATE OR IGNORE forms SET design = ?, bbcode = ?, bbcode_hash = ? WHERE id = ? AND bbcode_hash = ?",
+                    (json.dumps(record["design"], ensure_ascii=False), record["bbcode"], record["bbcode_hash"],
+                     form_id, old_hash))
+                if cursor.rowcount:
+                    note_hash_algorithm(connection, record["bbcode_hash"])
+                updated += cursor.rowcount
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return updated
+    
+    def load(self, form_id):
+        """Запись формы по номеру в том же формате, что и .json файл"""
+        import json
+        
+        connection = self.connect()
+        row = connection.execute(
+            "SELECT title, design, bbcode, bbcode_hash, generated FROM forms WHERE id = ?", (form_id,)).fetchone()
+        if row is None:
+            return None
+        questions = [
+            {"number": number, "question": question, "original": original, "answer": answer, "type": field_type}
+            for number, question, original, answer, field_type in connection.execute(
+                "SELECT number, question, original, answer, type FROM answers WHERE form_id = ? ORDER BY number",
+                (form_id,))
+        ]
+        return {"title": row[0], "questions": questions, "design": json.loads(row[1]),
+                "bbcode": row[2], "bbcode_hash": row[3], "generated": row[4]}
+    
+    def iter_records(self):
+        """Все сохраненные записи: (номер записи, данные)"""
+        form_ids = [row[0] for row in self.connect().execute("SELECT id FROM forms ORDER BY id")]
+        for form_id in form_ids:
+            record = self.load(form_id)
+            if record is not None:
+                yield form_id, record
+    
+    def import_folder(self, folder, batch_size=500):
+        """Перенос форм из папки с .json файлами (дубликаты пропускаются)"""
+        return import_folder_records(self, folder, batch_size)
+    
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def import_folder_records(storage, folder, batch_size=500):
+    """Перенос форм из папки с .json файлами в хранилище пачками
+    
+    Возвращает (найдено записей, добавлено новых).
+    """
+    found = saved = 0
+    batch = []
+    for file_name, data in FolderStorage(folder, None).iter_records():
+        if not data.get("bbcode_hash"):
+            continue
+        record = {
+            "title": data.get("title", ""),
+            "questions": data.get("questions", []),
+            "design": data.get("design", {}),
+            "bbcode": data["bbcode"],
+            "bbcode_hash": data["bbcode_hash"],
+            "generated": data.get("generated", "")
+        }
+        batch.append((record, file_name[:-len('.json')]))
+        found += 1
+        if len(batch) >= batch_size:
+            saved += storage.save_many(batch)
+            batch = []
+    if batch:
+        saved += storage.save_many(batch)
+    return found, saved
+
+
+def lock_file(f):
+    """Эксклюзивная блокировка открытого файла (Windows и Unix)"""
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def unlock_file(f):
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class ArchiveStorage:
+    """Архив форм: сжатые записи дописываются в файлы-сегменты
+    
+    Каждая запись - сжатый zlib JSON с длиной впереди. Для каждой записи
+    в index.bin дописывается строка фиксированного размера: ключ хэша,
+    номер сегмента, смещение и длина. Индекс и сегменты читаются через mmap,
+    поэтому проверка дубликатов и чтение записей не открывают тысячи файлов.
+    """
+    
+    INDEX_FILE = "index.bin"
+    LOCK_FILE = "archive.lock"
+    # Алгоритмы хэшей записей архива, по одному в строке (нет файла - только md5)
+    ALGORITHMS_FILE = "hash_algorithms.txt"
+    SEGMENT_LIMIT = 64 * 1024 * 1024
+    
+    # Ключ хэша (md5 от строки bbcode_hash), сегмент, смещение, длина.
+    # Строка с нулевой длиной означает, что запись заменена (перерисована)
+    ENTRY = "<16sIQI"
+    
+    def __init__(self, folder, stats=NULL_STATS):
+        import struct
+        
+        self.folder = folder
+        self.stats = stats
+        self.entry = struct.Struct(self.ENTRY)
+        self.index_path = os.path.join(folder, self.INDEX_FILE)
+        self._entries = {}
+        self._index_size = 0
+        self._segments = {}
+        self._last_segment = 1
+    
+    def describe(self):
+        return f"🗜️  Архив: {os.path.abspath(self.folder)}"
+    
+    def segment_path(self, number):
+        return os.path.join(self.folder, f"segment_{number:05d}.bin")
+    
+    def hash_key(self, bbcode_hash):
+        import hashlib
+        return hashlib.md5(bbcode_hash.encode('utf-8')).digest()
+    
+    def refresh(self):
+        """Чтение новых строк индекса (в том числе дописанных другими процессами)"""
+        import mmap
+        
+        try:
+            size = os.path.getsize(self.index_path)
+        except OSError:
+            return
+        size -= size % self.entry.size
+        if size <= self._index_size:
+            return
+        
+        with open(self.index_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for position in range(self._index_size, size, self.entry.size):
+                    key, segment, offset, length = self.entry.unpack_from(view, position)
+                    if not length:
+                        self._entries.pop(key, None)
+                        continue
+                    self._entries[key] = (segment, offset, length)
+                    self._last_segment = max(self._last_segment, segment)
+        self._index_size = size
+    
+    def find(self, bbcode_hash):
+        """Адрес записи "сегмент:смещение" с таким хэшем или None"""
+        self.refresh()
+        entry = self._entries.get(self.hash_key(bbcode_hash))
+        return f"segment_{entry[0]:05d}.bin:{entry[1]}" if entry else None
+    
+    def hash_algorithms(self):
+        """Алгоритмы, которыми посчитаны хэши сохраненных форм"""
+        try:
+            with open(os.path.join(self.folder, self.ALGORITHMS_FILE), 'r', encoding='utf-8') as f:
+                return {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            return {DEFAULT_HASH}
+    
+    def read(self, segment, offset, length):
+        """Запись из сегмента (через mmap)"""
+        import json
+        import mmap
+        import zlib
+        
+        view = self._segments.get(segment)
+        if view is None or len(view) < offset + length:
+            if view is not None:
+                view.close()
+            with open(self.segment_path(segment), 'rb') as f:
+                view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._segments[segment] = view
+        return json.loads(zlib.decompress(view[offset + 4:offset + length]))
+    
+    def save(self, record, name):
+        """Сохранение записи формы (формат результата как у FolderStorage.save)"""
+        saved = self._append([(record, name)])
+        if not saved:
+            return False, self.find(record["bbcode_hash"])
+        return True, [("🗜️  Запись", f"{self.folder}/{saved[0]}")]
+    
+    def save_many(self, records):
+        """Сохранение пачки пар (запись, имя); возвращает количество новых"""
+        return len(self._append(records))
+    
+    def replace(self, old_hash, record, name):
+        """Замена записи с хэшем old_hash новой версией формы
+        
+        False - записи с old_hash нет или такой BB-код уже есть в архиве.
+        """
+        if self.find(old_hash) is None or self.find(record["bbcode_hash"]) is not None:
+            return False
+        return bool(self._append([(record, name, old_hash)]))
+    
+    def update_many(self, updates):
+        """Замена записей (адрес, старый хэш, новая запись); возвращает количество
+        
+        Новая запись дописывается в конец, а старая помечается в индексе
+        как замененная. Если такой BB-код уже есть в архиве, старая запись
+        остается как была.
+        """
+        return len(self._append([(record, record.get("name", ""), old_hash) for _, old_hash, record in updates]))
+    
+    def _append(self, records):
+        """Дописывание записей под блокировкой; возвращает адреса новых
+        
+        records - пары (запись, имя) или тройки (запись, имя, хэш заменяемой записи).
+        """
+        import json
+        import zlib
+        
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        
+        added = []
+        with open(os.path.join(self.folder, self.LOCK_FILE), 'a+b') as lock:
+            lock_file(lock)
+            try:
+                self.refresh()
+                
+                # Алгоритмы отмечаются до записи: лишняя отметка безвредна,
+                # а пропущенная скрыла бы дубликаты
+                algorithms = self.hash_algorithms()
+                new_algorithms = {hash_algorithm(record["bbcode_hash"]) for record, *_ in records} - algorithms
+                if new_algorithms:
+                    with open(os.path.join(self.folder, self.ALGORITHMS_FILE), 'w', encoding='utf-8') as f:
+                        f.write("".join(f"{algorithm}\n" for algorithm in sorted(algorithms | new_algorithms)))
+                
+                # Дописываем в последний сегмент из индекса
+                segment = self._last_segment
+                data = open(self.segment_path(segment), 'ab')
+                index = open(self.index_path, 'ab')
+                try:
+                    # Недописанная строка индекса (сбой при прошлой записи) отрезается,
+                    # иначе все новые строки съехали бы и читались как мусор
+                    index_size = os.fstat(index.fileno()).st_size
+                    if index_size % self.entry.size:
+                        index.truncate(index_size - index_size % self.entry.size)
+                    
+                    offset = data.tell()
+                    for record, name, *replaced in records:
+                        key = self.hash_key(record["bbcode_hash"])
+                        if key in self._entries:
+                            continue
+                        
+                        payload = zlib.compress(json.dumps(dict(record, name=name), ensure_ascii=False,
+                                                           separators=(',', ':')).encode('utf-8'))
+                        if offset and offset + len(payload) + 4 > self.SEGMENT_LIMIT:
+                            # Сегмент заполнен - начинаем следующий
+                            data.flush()
+                            os.fsync(data.fileno())
+                            data.close()
+                            segment += 1
+                            self._last_segment = segment
+                            data = open(self.segment_path(segment), 'ab')
+                            offset = 0
+                        
+                        data.write(len(payload).to_bytes(4, 'little'))
+                        data.write(payload)
+                        length = len(payload) + 4
+                        index.write(self.entry.pack(key, segment, offset, length))
+                        
+                        self._entries[key] = (segment, offset, length)
+                        added.append(f"segment_{segment:05d}.bin:{offset}")
+                        offset += length
+                        
+                        if replaced:
+                            # Заменяемая запись помечается только после того, как
+                            # записана новая, - при сбое форма не пропадет
+                            old_key = self.hash_key(replaced[0])
+                            if self._entries.pop(old_key, None):
+                                index.write(self.entry.pack(old_key, 0, 0, 0))
+                        
+                        if self.stats.enabled:
+                            self.stats.count("save.bytes_written", length + self.entry.size)
+                    
+                    # Сначала на диск попадают данные, потом строки индекса
+                    data.flush()
+                    os.fsync(data.fileno())
+                    index.flush()
+                    os.fsync(index.fileno())
+                finally:
+                    data.close()
+                    index.close()
+                self._index_size = os.path.getsize(self.index_path)
+            finally:
+                unlock_file(lock)
+        return added
+    
+    def iter_records(self):
+        """Все сохраненные записи: (адрес "сегмент:смещение", данные)"""
+        self.refresh()
+        for segment, offset, length in list(self._entries.values()):
+            yield f"segment_{segment:05d}.bin:{offset}", self.read(segment, offset, length)
+    
+    def import_folder(self, folder, batch_size=500):
+        """Перенос форм из папки с .json файлами (дубликаты пропускаются)"""
+        return import_folder_records(self, folder, batch_size)
+    
+    def close(self):
+        for view in self._segments.values():
+            view.close()
+        self._segments = {}
+
+
+class FormHistory:
+    """История версий сохраненных форм: по файлу history/<имя формы>.jsonl
+    
+    Первая строка файла - форма целиком (заголовок, стиль, вопросы с
+    ответами), каждая следующая - только то, что изменилось при повторном
+    сохранении: ответы по номерам вопросов и стиль, если он другой. Любая
+    версия собирается заново, начиная с первой строки.
+    """
+    
+    def __init__(self, folder):
+        self.folder = folder
+        # Последняя версия форм, которые уже сохранялись в этом сеансе
+        self._latest = {}
+    
+    def path(self, name):
+        return os.path.join(self.folder, f"{name}.jsonl")
+    
+    def exists(self, name):
+        return name in self._latest or os.path.exists(self.path(name))
+    
+    def _write(self, name, entry):
+        import json
+        
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        with open(self.path(name), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    
+    def entries(self, name):
+        """Строки истории формы по порядку (пустой список, если истории нет)"""
+        import json
+        
+        if not os.path.exists(self.path(name)):
+            return []
+        with open(self.path(name), encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    
+    def start(self, name, record, minified=False):
+        """Первая версия формы - запись целиком"""
+        entry = {
+            "version": 1,
+            "generated": record["generated"],
+            "title": record["title"],
+            "design": record["design"],
+            "questions": record["questions"],
+            "bbcode_hash": record["bbcode_hash"],
+            "minified": minified
+        }
+        self._write(name, entry)
+        self._latest[name] = self.rebuild(name, entries=[entry])
+    
+    def append(self, name, record, minified=False):
+        """Новая версия: только изменившиеся ответы и стиль; возвращает номер версии"""
+        previous = self._latest.get(name) or self.rebuild(name)
+        if previous is None:
+            self.start(name, record, minified)
+            return 1
+        
+        entry = {"version": previous["version"] + 1, "generated": record["generated"]}
+        old_answers = {q["number"]: q.get("answer") for q in previous["questions"]}
+        if [q["number"] for q in record["questions"]] == list(old_answers):
+            entry["answers"] = {str(q["number"]): q.get("answer") for q in record["questions"]
+                                if q.get("answer") != old_answers[q["number"]]}
+        else:
+            # Другой набор вопросов - сохраняем их целиком
+            entry["questions"] = record["questions"]
+        if record["design"] != previous["design"]:
+            entry["design"] = record["design"]
+        entry["bbcode_hash"] = record["bbcode_hash"]
+        if minified != previous["minified"]:
+            entry["minified"] = minified
+        
+        self._write(name, entry)
+        self._latest[name] = self.rebuild(name, entries=[previous, entry])
+        return entry["version"]
+    
+    def rebuild(self, name, version=None, entries=None):
+        """Форма в указанной версии (по умолчанию последней) или None
+        
+        Результат - словарь как первая строка истории, с номером версии.
+        """
+        entries = self.entries(name) if entries is None else entries
+        if not entries or (version is not None and not 1 <= version <= len(entries)):
+            return None
+        
+        state = dict(entries[0])
+        state["questions"] = [dict(q) for q in state["questions"]]
+        for entry in entries[1:version]:
+            if "questions" in entry:
+                state["questions"] = [dict(q) for q in entry["questions"]]
+            answers = entry.get("answers", {})
+            for q in state["questions"]:
+                q["answer"] = answers.get(str(q["number"]), q.get("answer"))
+            for key in ("design", "bbcode_hash", "generated", "minified", "version"):
+                if key in entry:
+                    state[key] = entry[key]
+        return state
+    
+    def names(self):
+        """Имена форм, у которых есть история"""
+        if not os.path.exists(self.folder):
+            return []
+        return sorted(file_name[:-len(".jsonl")] for file_name in os.listdir(self.folder)
+                      if file_name.endswith(".jsonl"))
+
 
 class ImprovedFormGenerator:
+    # Этапы, которые замеряются при включенной статистике: этап -> метод
+    STAT_STAGES = {
+        "input": "get_form_input",
+        "parse": "parse_form_stream",
+        "fill": "fill_form",
+        "validate": "validate_input",
+        "preview": "preview_form",
+        "render": "generate_bbcode",
+        "rerender": "render_form",
+        "hash": "get_bbcode_hash",
+        "save": "save_results",
+        "update_check": "fetch_latest_version",
+    }
+    
     def __init__(self):
         # УЛУЧШЕННЫЕ ЦВЕТА для лучшей читаемости
         self.designs = {
@@ -48,17 +2200,74 @@ class ImprovedFormGenerator:
         }
         
         self.output_folder = "form_blackrussia"
+        self.stats = NULL_STATS
+        self.hash_index = HashIndex(self.output_folder, self.stats)
+        self.parse_cache = ParseCache(os.path.join(self.output_folder, "parse_cache"), stats=self.stats)
+        self.templates = TemplateLibrary(os.path.join(self.output_folder, "templates.bin"), self.parse_form_lines)
+        self.history = FormHistory(os.path.join(self.output_folder, "history"))
+        
+        # Где хранить сохраненные формы: "folder" (файлы .txt/.json), "sqlite"
+        # или "archive" (сжатые сегменты)
+        self.storage_backend = "folder"
+        self._sqlite_storage = None
+        self._archive_storage = None
+        
+        # Убирать лишние теги из готового BB-кода (minify_bbcode)
+        self.minify_output = False
+        
+        # Другие форматы (html, markdown) вместе с BB-кодом в пакетном режиме
+        self.export_formats = ()
+        
+        # Алгоритм хэша BB-кода (HASH_ALGORITHMS); md5 совместим со старыми формами
+        self.hash_algorithm = DEFAULT_HASH
+        
+        # Лимит длины поста на форуме (None - не делить BB-код на посты)
+        self.post_limit = None
+        self.post_limit_bytes = False
         
         # Информация о версии и обновлениях
         self.current_version = "1.1.0"
         self.update_check_url = "https://raw.githubusercontent.com/1hysq/forum_disain/main/version.txt"
         self.github_page_url = "https://github.com/1hysq/forum_disain"
+        self.update_cache_file = "update_cache.json"
+        self.update_check_interval = datetime.timedelta(days=1)  # Проверка при запуске - раз в день
+        self.available_update = None  # Заполняется фоновой проверкой
         
-        # Создаем папку при инициализации
-        self.create_output_folder()
+        # Папка создается при первом сохранении, а обновления проверяет main(),
+        # поэтому создание генератора не трогает ни диск, ни сеть
+    
+    def enable_stats(self):
+        """Включение замеров времени и счетчиков по этапам"""
+        self.stats = StageStats()
+        self.hash_index.stats = self.stats
+        self.parse_cache.stats = self.stats
+        for stage, method_name in self.STAT_STAGES.items():
+            setattr(self, method_name, self.stats.wrap(stage, getattr(self, method_name)))
+        return self.stats
+    
+    def use_memory_parse_cache(self):
+        """Кэш разбора только в памяти (пакетный режим, сервис, процессы пула)
         
-        # Проверяем обновления при запуске
-        self.check_for_updates_on_start()
+        Формы из заданий и запросов обычно разовые, и на диске они только
+        копились бы в папке сохраненных форм пользователя.
+        """
+        self.parse_cache = ParseCache(None, stats=self.stats)
+    
+    def get_storage(self):
+        """Хранилище сохраненных форм для выбранного storage_backend"""
+        if self.storage_backend == "sqlite":
+            path = os.path.join(self.output_folder, SqliteStorage.FILE_NAME)
+            if self._sqlite_storage is None or self._sqlite_storage.path != path:
+                self._sqlite_storage = SqliteStorage(path, self.stats)
+            self._sqlite_storage.stats = self.stats
+            return self._sqlite_storage
+        if self.storage_backend == "archive":
+            folder = os.path.join(self.output_folder, "archive")
+            if self._archive_storage is None or self._archive_storage.folder != folder:
+                self._archive_storage = ArchiveStorage(folder, self.stats)
+            self._archive_storage.stats = self.stats
+            return self._archive_storage
+        return FolderStorage(self.output_folder, self.hash_index, self.stats)
     
     def create_output_folder(self):
         """Создание папки для сохранения результатов"""
@@ -76,78 +2285,155 @@ class ImprovedFormGenerator:
         print("═" * 60)
     
     def check_for_updates_on_start(self):
-        """Проверка обновлений при запуске программы"""
+        """Проверка обновлений при запуске программы
+        
+        Проверка идет в фоновом потоке и не задерживает главное меню.
+        Если найдется новая версия, меню покажет ее при следующей отрисовке.
+        В сеть проверка идет не чаще раза в update_check_interval, в
+        остальное время версия берется из кэша.
+        """
+        import threading
+        
+        thread = threading.Thread(target=self.background_update_check, name="update-check", daemon=True)
+        thread.start()
+        return thread
+    
+    def background_update_check(self):
+        """Тело фоновой проверки обновлений"""
+        cache = self.load_update_cache()
+        if self.update_checked_recently(cache):
+            # Проверяли меньше update_check_interval назад - в сеть не идем
+            latest_version = cache["latest_version"]
+        else:
+            try:
+                latest_version = self.fetch_latest_version()
+            except Exception:
+                # Нет сети - показываем то, что узнали в прошлый раз
+                latest_version = cache.get("latest_version")
+        
+        if latest_version and self.compare_versions(self.current_version, latest_version) < 0:
+            self.available_update = latest_version
+    
+    def load_update_cache(self):
+        """Кэш последней проверки обновлений (ETag, Last-Modified, версия)"""
+        import json
+        
         try:
-            # Проверяем, когда последний раз проверяли обновления
-            last_check_file = "last_update_check.txt"
-            should_check = True
-            
-            if os.path.exists(last_check_file):
-                with open(last_check_file, 'r') as f:
-                    try:
-                        last_check = datetime.datetime.fromisoformat(f.read().strip())
-                        now = datetime.datetime.now()
-                        # Проверяем раз в день
-                        if (now - last_check).days < 1:
-                            should_check = False
-                    except:
-                        pass
-            
-            if should_check:
-                self.check_for_updates(silent=True)
-                # Сохраняем время проверки
-                with open(last_check_file, 'w') as f:
-                    f.write(datetime.datetime.now().isoformat())
-                    
-        except Exception as e:
-            # Молча игнорируем ошибки при проверке обновлений
+            with open(self.update_cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        
+        # Кэш от другого адреса не подходит
+        if not isinstance(cache, dict) or cache.get("url") != self.update_check_url:
+            return {}
+        return cache
+    
+    def update_checked_recently(self, cache):
+        """Была ли успешная проверка обновлений меньше update_check_interval назад"""
+        if not cache.get("latest_version"):
+            return False
+        try:
+            checked = datetime.datetime.fromisoformat(cache["checked"])
+        except (KeyError, TypeError, ValueError):
+            return False
+        return datetime.datetime.now() - checked < self.update_check_interval
+    
+    def save_update_cache(self, cache):
+        """Сохранение кэша проверки обновлений"""
+        import json
+        
+        try:
+            with open(self.update_cache_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+        except OSError:
             pass
     
+    def fetch_latest_version(self, timeout=5):
+        """Последняя версия из version.txt
+        
+        Запрос условный (If-None-Match / If-Modified-Since): если файл не
+        менялся, сервер отвечает 304 и версия берется из кэша.
+        """
+        import urllib.request
+        import urllib.error
+        
+        cache = self.load_update_cache()
+        
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        if cache.get("latest_version"):
+            if cache.get("etag"):
+                headers['If-None-Match'] = cache["etag"]
+            if cache.get("last_modified"):
+                headers['If-Modified-Since'] = cache["last_modified"]
+        req = urllib.request.Request(self.update_check_url, headers=headers)
+        
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as response:
+                content = response.read().decode('utf-8').strip()
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cache.get("latest_version"):
+                cache["checked"] = datetime.datetime.now().isoformat()
+                self.save_update_cache(cache)
+                return cache["latest_version"]
+            raise
+        
+        # Убираем все лишние символы, оставляем только версию
+        # Ищем версию в формате X.X.X или X.X.X.X
+        version_match = re.search(r'(\d+\.\d+(?:\.\d+)*)', content)
+        if not version_match:
+            raise ValueError(f"Не удалось найти версию в файле. Содержимое: '{content}'")
+        
+        latest_version = version_match.group(1)
+        self.save_update_cache({
+            "url": self.update_check_url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "latest_version": latest_version,
+            "checked": datetime.datetime.now().isoformat()
+        })
+        return latest_version
+    
     def check_for_updates(self, silent=False):
         """Проверка наличия обновлений"""
+        import urllib.error
+        
         try:
             if not silent:
                 print("\n🔍 Проверяем наличие обновлений...")
             
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            req = urllib.request.Request(self.update_check_url, headers=headers)
+            latest_version = self.fetch_latest_version()
             
-            with urllib.request.urlopen(req, timeout=5) as response:
-                content = response.read().decode('utf-8').strip()
-                
-                # Убираем все лишние символы, оставляем только версию
-                # Ищем версию в формате X.X.X или X.X.X.X
-                version_match = re.search(r'(\d+\.\d+(?:\.\d+)*)', content)
-                if version_match:
-                    latest_version = version_match.group(1)
-                    
-                    # Сравниваем версии
-                    comparison = self.compare_versions(self.current_version, latest_version)
+            # Сравниваем версии
+            comparison = self.compare_versions(self.current_version, latest_version)
+            
+            if comparison < 0:
+                self.available_update = latest_version
+                if not silent:
+                    print(f"\n🎉 Доступно обновление!")
+                    print(f"   Текущая версия: {self.current_version}")
+                    print(f"   Новая версия: {latest_version}")
+                    print(f"\n📥 Скачать обновление можно по ссылке:")
+                    print(f"   {self.github_page_url}")
                     
-                    if comparison < 0:
-                        if not silent:
-                            print(f"\n🎉 Доступно обновление!")
-                            print(f"   Текущая версия: {self.current_version}")
-                            print(f"   Новая версия: {latest_version}")
-                            print(f"\n📥 Скачать обновление можно по ссылке:")
-                            print(f"   {self.github_page_url}")
-                            
-                            choice = input("\nХотите открыть страницу загрузки? (y/n): ").lower()
-                            if choice == 'y':
-                                webbrowser.open(self.github_page_url)
-                        return True
-                    else:
-                        if not silent:
-                            print("✅ У вас установлена последняя версия!")
-                        return False
-                else:
-                    if not silent:
-                        print(f"❌ Не удалось найти версию в файле. Содержимое: '{content}'")
-                    return False
+                    choice = input("\nХотите открыть страницу загрузки? (y/n): ").lower()
+                    if choice == 'y':
+                        import webbrowser
+                        webbrowser.open(self.github_page_url)
+                return True
+            else:
+                if not silent:
+                    print("✅ У вас установлена последняя версия!")
+                return False
                 
         except urllib.error.URLError:
             if not silent:
                 print("❌ Не удалось проверить обновления. Проверьте подключение к интернету.")
+        except ValueError as e:
+            if not silent:
+                print(f"❌ {e}")
         except Exception as e:
             if not silent:
                 print(f"❌ Ошибка при проверке обновлений: {e}")
@@ -187,82 +2473,81 @@ class ImprovedFormGenerator:
     
     def get_form_input(self):
         """Получение формы от пользователя - УЛУЧШЕННАЯ ВЕРСИЯ"""
-        self.clear_screen()
-        self.print_title("ВВОД ФОРМЫ")
-        
-        print("📝 Вставьте вашу форму целиком (копируйте из темы на форуме)")
-        print("\n📌 ВАЖНО: После вставки просто дважды нажмите Enter для завершения")
-        print("   Это быстро и защищает от случайного ввода!")
-        print("-" * 60)
-        
-        print("\n📋 ВСТАВЬТЕ ВАШУ ФОРМУ СЕЙЧАС:")
-        print("=" * 60)
-        
-        lines = []
-        print("\n[Начинайте ввод. Для завершения введите две пустые строки подряд]\n")
-        
-        empty_line_count = 0
-        
+        # Повторный ввод после ответа "нет" - новый круг цикла, а не рекурсия
         while True:
-            try:
-                line = input().rstrip('\n')
-                
-                # Проверяем на пустую строку
-                if line == "":
-                    empty_line_count += 1
-                    if empty_line_count >= 2:
-                        print("\n✅ Ввод завершен (две пустые строки)")
-                        break
-                    continue
-                else:
-                    empty_line_count = 0
-                
-                lines.append(line)
+            self.clear_screen()
+            self.print_title("ВВОД ФОРМЫ")
+            
+            print("📝 Вставьте вашу форму целиком (копируйте из темы на форуме)")
+            print("\n📌 ВАЖНО: После вставки просто дважды нажмите Enter для завершения")
+            print("   Это быстро и защищает от случайного ввода!")
+            print("-" * 60)
+            
+            print("\n📋 ВСТАВЬТЕ ВАШУ ФОРМУ СЕЙЧАС:")
+            print("=" * 60)
+            
+            lines = []
+            print("\n[Начинайте ввод. Для завершения введите две пустые строки подряд]\n")
+            
+            empty_line_count = 0
+            
+            while True:
+                try:
+                    line = input().rstrip('\n')
                     
-            except KeyboardInterrupt:
-                print("\n\n⚠️  Ввод прерван пользователем.")
-                confirm = input("Завершить ввод? (y/n): ").lower()
-                if confirm == 'y':
+                    # Проверяем на пустую строку
+                    if line == "":
+                        empty_line_count += 1
+                        if empty_line_count >= 2:
+                            print("\n✅ Ввод завершен (две пустые строки)")
+                            break
+                        continue
+                    else:
+                        empty_line_count = 0
+                    
+                    lines.append(line)
+                        
+                except KeyboardInterrupt:
+                    print("\n\n⚠️  Ввод прерван пользователем.")
+                    confirm = input("Завершить ввод? (y/n): ").lower()
+                    if confirm == 'y':
+                        break
+                    else:
+                        print("Продолжайте ввод...")
+                        empty_line_count = 0
+                        continue
+                except EOFError:
+                    print("\n\n📥 Обнаружен конец ввода. Завершаем...")
                     break
-                else:
-                    print("Продолжайте ввод...")
-                    empty_line_count = 0
-                    continue
-            except EOFError:
-                print("\n\n📥 Обнаружен конец ввода. Завершаем...")
-                break
-            except Exception as e:
-                print(f"\n⚠️  Произошла ошибка: {e}")
+                except Exception as e:
+                    print(f"\n⚠️  Произошла ошибка: {e}")
+                    return None, None
+            
+            if not lines:
+                print("❌ Вы не ввели форму!")
                 return None, None
-        
-        if not lines:
-            print("❌ Вы не ввели форму!")
-            return None, None
-        
-        # Объединяем в одну строку
-        full_text = "\n".join(lines)
-        
-        # Быстрая проверка
-        print(f"\n✅ Получено строк: {len(lines)}")
-        print(f"📏 Длина текста: {len(full_text)} символов")
-        
-        # Показываем первые 3 строки для проверки
-        print("\n📄 ПРЕДПРОСМОТР (первые 3 строки):")
-        print("-" * 40)
-        for i, line in enumerate(lines[:3]):
-            print(f"{i+1}: {line[:80]}{'...' if len(line) > 80 else ''}")
-        if len(lines) > 3:
-            print(f"... и еще {len(lines) - 3} строк")
-        print("-" * 40)
-        
-        # Быстрое подтверждение
-        confirm = input("\n✅ Форма введена правильно? (y/n): ").lower()
-        if confirm != 'y':
-            print("\n🔄 Попробуем еще раз...")
-            return self.get_form_input()
-        
-        # Извлекаем заголовок и вопросы
-        return self.parse_full_form(full_text)
+            
+            # Быстрая проверка
+            print(f"\n✅ Получено строк: {len(lines)}")
+            print(f"📏 Длина текста: {sum(len(line) for line in lines) + len(lines) - 1} символов")
+            
+            # Показываем первые 3 строки для проверки
+            print("\n📄 ПРЕДПРОСМОТР (первые 3 строки):")
+            print("-" * 40)
+            for i, line in enumerate(lines[:3]):
+                print(f"{i+1}: {line[:80]}{'...' if len(line) > 80 else ''}")
+            if len(lines) > 3:
+                print(f"... и еще {len(lines) - 3} строк")
+            print("-" * 40)
+            
+            # Быстрое подтверждение
+            confirm = input("\n✅ Форма введена правильно? (y/n): ").lower()
+            if confirm != 'y':
+                print("\n🔄 Попробуем еще раз...")
+                continue
+            
+            # Извлекаем заголовок и вопросы прямо из введенных строк
+            return self.parse_form_lines(lines)
     
     def remove_questions(self, questions):
         """Удаление ненужных вопросов из формы"""
@@ -359,146 +2644,61 @@ class ImprovedFormGenerator:
     
     def parse_full_form(self, text):
         """Парсинг полной формы - УЛУЧШЕННАЯ ВЕРСИЯ"""
-        lines = [line.rstrip() for line in text.split('\n') if line.strip() != '']
-        
-        if not lines:
-            return "ФОРМА ЗАЯВЛЕНИЯ", []
-        
-        # Ищем заголовок
-        title = "ФОРМА ЗАЯВЛЕНИЯ"
-        for i, line in enumerate(lines):
-            if any(word in line.lower() for word in ["форма", "заявление", "анкета", "заявка"]):
-                title = line
-                break
-        
-        # Ищем вопросы - улучшенная логика
-        questions = []
-        current_question = []
-        in_question = False
-        
-        for line in lines:
-            # Проверяем, начинается ли строка с номера вопроса
-            if re.match(r'^\d+[\.\)]\s*', line):
-                # Сохраняем предыдущий вопрос, если он есть
-                if current_question and in_question:
-                    question_text = ' '.join(current_question).strip()
-                    if question_text:
-                        questions.append({
-                            "number": len(questions) + 1,
-                            "original": question_text,
-                            "clean": self.clean_question_text(question_text),
-                            "type": self.detect_field_type(question_text)
-                        })
-                    current_question = []
-                
-                in_question = True
-                current_question.append(line)
-            elif in_question:
-                # Продолжение вопроса (многострочные вопросы)
-                current_question.append(line)
-        
-        # Добавляем последний вопрос
-        if current_question and in_question:
-            question_text = ' '.join(current_question).strip()
-            if question_text:
-                questions.append({
-                    "number": len(questions) + 1,
-                    "original": question_text,
-                    "clean": self.clean_question_text(question_text),
-                    "type": self.detect_field_type(question_text)
-                })
-        
-        # Если не нашли вопросы стандартным способом, пытаемся другим
-        if not questions:
-            return self.alternative_parse(lines)
-        
-        return title, questions
+        return self.parse_form_lines(text.split('\n'))
     
-    def alternative_parse(self, lines):
-        """Альтернативный парсинг для сложных случаев"""
-        title = "ФОРМА ЗАЯВЛЕНИЯ"
-        questions = []
-        
-        for i, line in enumerate(lines):
-            if any(word in line.lower() for word in ["форма", "заявление", "анкета"]):
-                title = line
-            elif re.match(r'^\d+[\.\)]\s*', line):
-                questions.append({
-                    "number": len(questions) + 1,
-                    "original": line,
-                    "clean": self.clean_question_text(line),
-                    "type": self.detect_field_type(line)
-                })
+    def parse_form_lines(self, lines):
+        """Разбор формы из списка строк с использованием кэша шаблонов"""
+        key = self.parse_cache.key(lines)
+        cached = self.parse_cache.get(key)
+        if cached is not None:
+            return cached
         
+        title, questions = self.parse_form_stream(lines)
+        self.parse_cache.put(key, title, questions)
         return title, questions
     
+    def iter_form_stream(self, lines):
+        """Потоковый парсер для файла, stdin или списка строк"""
+        return FormStreamParser(self, lines)
+    
+    def parse_form_stream(self, lines):
+        """Разбор формы из любого источника строк в (заголовок, вопросы)"""
+        parser = self.iter_form_stream(lines)
+        questions = list(parser)
+        return parser.title, questions
+    
     def detect_field_type(self, question):
         """Определение типа поля по вопросу"""
-        question_lower = question.lower()
+        categories = FIELD_CLASSIFIER.classify(question)
         
         # Скриншоты
-        if any(word in question_lower for word in ["скриншот", "screenshot", "/time", "статистик", "статистики"]):
+        if "screenshot" in categories:
             return "screenshot"
         
         # Ссылки
-        if any(word in question_lower for word in ["ссылка", "url", "сайт", "профиль", "биографи", "биография", "vk", "вк", "дискорд"]):
+        if "link" in categories:
             return "link"
         
         # Длинные вопросы
-        if len(question) > 50 or any(word in question_lower for word in ["почему", "расскажите", "обоснование", "считаете"]):
+        if len(question) > 50 or "multiline" in categories:
             return "multiline"
         
         # По умолчанию - текст
         return "text"
     
     def validate_input(self, question_text, answer, field_type):
-        """Проверка введенных данных на валидность"""
-        question_lower = question_text.lower()
-        
-        # Проверка возраста
-        if any(word in question_lower for word in ["возраст", "лет", "годиков", "года", "годков", "age", "сколько лет"]):
-            try:
-                age = int(answer)
-                if age < 14 or age > 100:
-                    return False, "⚠️  Возраст должен быть в диапазоне от 14 до 100 лет."
-                if age < 18:
-                    return True, "⚠️  Внимание: вам меньше 18 лет. Убедитесь, что это правильно."
-            except ValueError:
-                return False, "⚠️  Возраст должен быть целым числом."
-        
-        # Проверка никнейма (не пустой и не слишком длинный)
-        if any(word in question_lower for word in ["никнейм", "ник", "логин", "nickname", "nick"]):
-            if not answer.strip():
-                return False, "⚠️  Никнейм не может быть пустым."
-            if len(answer) > 25:
-                return False, "⚠️  Никнейм слишком длинный (максимум 25 символов)."
-            if len(answer) < 3:
-                return False, "⚠️  Никнейм слишком короткий (минимум 3 символа)."
-        
-        # Проверка уровня
-        if any(word in question_lower for word in ["уровень", "level", "lvl"]):
-            try:
-                level = int(answer)
-                if level < 1 or level > 100:
-                    return False, "⚠️  Уровень должен быть в диапазоне от 1 до 100."
-            except ValueError:
-                return False, "⚠️  Уровень должен быть целым числом."
-        
-        # Проверка часового пояса
-        if any(word in question_lower for word in ["часовой пояс", "таймзона", "timezone", "часовой"]):
-            if not any(word in answer.lower() for word in ["gmt", "utc", "msk", "+", "-"]):
-                return True, "⚠️  Убедитесь, что правильно указали часовой пояс (например, GMT+3, UTC+5, MSK)."
-        
-        # Проверка ссылок
-        if field_type == "link" or field_type == "screenshot":
-            if not answer.startswith(("http://", "https://")):
-                return False, "⚠️  Ссылка должна начинаться с http:// или https://"
-        
-        # Общая проверка на слишком короткий ответ
-        if len(answer.strip()) < 2 and field_type == "text":
-            return True, "⚠️  Ответ очень короткий. Убедитесь, что это правильно."
+        """Проверка введенных данных на валидность (правила - в VALIDATION_RULES)"""
+        return ANSWER_RULES.validate(question_text, answer, field_type)
+    
+    def validate_column(self, question_text, answers, field_type=None):
+        """Проверка всех ответов на один вопрос (например, возраста из всех заявок)
         
-        return True, "✅ Ответ принят"
+        Возвращает список (ответ допустим, сообщение) в порядке answers -
+        то же, что вызов validate_input для каждого ответа, но за один проход.
+        """
+        if field_type is None:
+            field_type = self.detect_field_type(question_text)
+        return ANSWER_RULES.validate_column(question_text, answers, field_type)
     
     def fill_form(self, title, questions):
         """Заполнение формы"""
@@ -614,13 +2814,7 @@ class ImprovedFormGenerator:
                         break
             
             # Сохраняем заполненный вопрос
-            filled_questions.append({
-                "number": q["number"],
-                "question": q["clean"],
-                "original": q["original"],
-                "answer": answer,
-                "type": field_type
-            })
+            filled_questions.append(Question.coerce(q).with_answer(answer))
         
         return filled_questions
     
@@ -773,126 +2967,137 @@ class ImprovedFormGenerator:
     
     def generate_bbcode(self, title, filled_questions, design):
         """Генерация BB-кода"""
+        return RenderPlan.for_design(design).render(title, filled_questions)
+    
+    def render_form(self, title, filled_questions, design):
+        """BB-код и хэш формы по строкам (для повторной отрисовки после правок)
         
-        # Создаем строки таблицы
-        rows = []
+        Хэш считается по ходу отрисовки и совпадает с get_bbcode_hash(bbcode).
+        """
+        return RenderPlan.for_design(design).render_incremental(title, filled_questions, self.hash_algorithm)
+    
+    def export_form(self, title, filled_questions, design, formats):
+        """BB-код и форма в других форматах (EXPORT_FORMATS) за один проход"""
+        return render_formats(title, filled_questions, design, ("bbcode", *formats))
+    
+    def minify_bbcode(self, bbcode):
+        """(BB-код без лишних тегов, сколько байт сэкономлено)"""
+        minified = minify_bbcode(bbcode)
+        saved = len(bbcode.encode('utf-8')) - len(minified.encode('utf-8'))
+        if self.stats.enabled:
+            self.stats.count("minify.bytes_saved", saved)
+        return minified, saved
+    
+    def split_posts(self, bbcode):
+        """BB-код, разделенный на посты по лимиту форума (ValueError, если не выходит)"""
+        measure = utf8_length if self.post_limit_bytes else len
+        return split_bbcode(bbcode, self.post_limit, measure)
+    
+    def output_settings(self):
+        """Настройки вывода BB-кода, которые передаются процессам пула"""
+        return {
+            "minify_output": self.minify_output,
+            "export_formats": self.export_formats,
+            "hash_algorithm": self.hash_algorithm,
+            "post_limit": self.post_limit,
+            "post_limit_bytes": self.post_limit_bytes
+        }
+    
+    def make_render_pool(self, workers=None):
+        """Пул процессов для отрисовки (None - по числу ядер)
         
-        for q in filled_questions:
-            # Форматируем вопрос (убираем лишние пробелы, добавляем двоеточие)
-            question_text = q["question"]
-            if not question_text.endswith(":"):
-                question_text = f"{question_text}:"
-            
-            question_display = f"ВОПРОС {q['number']}. {question_text}"
-            answer = q["answer"]
-            field_type = q["type"]
-            
-            # Обработка разных типов ответов
-            if field_type == "screenshot":
-                if answer:
-                    answer_bb = f'[color={design["link"]}][url={answer}]Скриншот[/url][/color]'
-                else:
-                    answer_bb = f'[color={design["answer"]}](скриншот не загружен)[/color]'
-            
-            elif field_type == "link":
-                if answer:
-                    # Определяем текст для ссылки
-                    q_lower = q["question"].lower()
-                    if "vk" in q_lower or "вк" in q_lower:
-                        display_text = "Профиль ВК"
-                    elif "discord" in q_lower or "дискорд" in q_lower:
-                        display_text = "Discord"
-                    elif "биограф" in q_lower:
-                        display_text = "Биография"
-                    else:
-                        display_text = "Ссылка"
-                    
-                    answer_bb = f'[color={design["link"]}][url={answer}]{display_text}[/url][/color]'
-                else:
-                    answer_bb = f'[color={design["answer"]}](ссылка не указана)[/color]'
-            
-            elif field_type == "multiline":
-                if answer:
-                    lines = answer.split('\n')
-                    formatted_lines = []
-                    for line in lines:
-                        if line.strip():
-                            formatted_lines.append(f'[color={design["answer"]}]{line.strip()}[/color]')
-                    answer_bb = '\n'.join(formatted_lines)
-                else:
-                    answer_bb = f'[color={design["answer"]}](не заполнено)[/color]'
-            
-            else:  # Обычный текст
-                answer_bb = f'[color={design["answer"]}]{answer}[/color]'
-            
-            # Создаем строку таблицы
-            row = f'[tr][td][color={design["question"]}][b]{question_display}[/b][/color][/td][td]{answer_bb}[/td][/tr]'
-            rows.append(row)
+        Каждый процесс один раз собирает свой генератор и планы отрисовки
+        стандартных дизайнов, а не делает это для каждой формы. С --stats
+        процессы тоже ведут замеры и возвращают их вместе с результатами.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(workers, initializer=init_render_worker,
+                                   initargs=(self.output_folder, list(self.designs.values()),
+                                             self.output_settings(), self.stats.enabled))
+    
+    def generate_bbcode_many(self, forms, workers=None, chunk_size=64):
+        """BB-код для многих форм сразу на всех ядрах
         
-        # Собираем полный BB-код
-        bbcode = f"""[center][font=Courier New]
-[size=11][b][color={design["header"]}]┌────────────────────┐[/color]
-{title.upper()}
-[color={design["header"]}]└────────────────────┘[/color][/b][/size]
-
-[size=9]
-[table]
-{"\n".join(rows)}
-[/table]
-[/size]
-[/font][/center]"""
+        forms - список (заголовок, заполненные вопросы, дизайн). Формы
+        раздаются процессам пачками по chunk_size, результаты идут в том же
+        порядке, что и forms. workers=0 - отрисовка без пула.
+        """
+        forms = list(forms)
+        if workers == 0:
+            return [self.generate_bbcode(title, filled_questions, design)
+                    for title, filled_questions, design in forms]
         
-        return bbcode
+        chunks = [forms[start:start + chunk_size] for start in range(0, len(forms), chunk_size)]
+        with self.make_render_pool(workers) as pool:
+            return [bbcode for chunk in pool.map(render_chunk, chunks) for bbcode in chunk]
     
     def get_bbcode_hash(self, bbcode):
         """Получение хэша BB-кода для сравнения"""
-        return hashlib.md5(bbcode.encode('utf-8')).hexdigest()
+        return hash_text(bbcode, self.hash_algorithm)
     
-    def save_results(self, title, filled_questions, bbcode, design, bbcode_hash):
-        """Сохранение результатов"""
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_title = title.replace(" ", "_").replace(":", "").lower()[:20]
+    def find_saved_copy(self, storage, bbcode, algorithms=None):
+        """Где сохранен такой же BB-код с хэшем другого алгоритма (или None)
         
-        # Гарантируем, что папка существует
-        if not os.path.exists(self.output_folder):
-            os.makedirs(self.output_folder)
+        Хэши разных алгоритмов не совпадают, поэтому форма, сохраненная
+        с другим --hash, ищется по хэшу каждого алгоритма, который есть
+        в хранилище. algorithms - storage.hash_algorithms(), если уже известны.
+        """
+        if algorithms is None:
+            algorithms = storage.hash_algorithms()
+        for algorithm in sorted(algorithms - {self.hash_algorithm}):
+            location = storage.find(hash_text(bbcode, algorithm))
+            if location is not None:
+                return location
+        return None
+    
+    def safe_title(self, title):
+        """Заголовок формы в виде, пригодном для имени файла"""
+        return title.replace(" ", "_").replace(":", "").lower()[:20]
+    
+    def save_results(self, title, filled_questions, bbcode, design, bbcode_hash, previous=None):
+        """Сохранение результатов
         
-        # Проверяем, был ли уже сохранен такой же BB-код
-        existing_files = os.listdir(self.output_folder)
-        for file_name in existing_files:
-            if file_name.endswith('.json'):
-                try:
-                    with open(os.path.join(self.output_folder, file_name), 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        if 'bbcode_hash' in data and data['bbcode_hash'] == bbcode_hash:
-                            print("\n⚠️  Этот BB-код уже был сохранен ранее!")
-                            print("Файл:", file_name)
-                            print("Возвращаемся в главное меню...")
-                            return False, None
-                except:
-                    continue
+        previous - (имя, запись) версии этой же формы, сохраненной раньше в
+        этом меню. Тогда сохраненная запись заменяется новой версией, а в
+        историю (FormHistory) дописываются только изменившиеся ответы.
+        Возвращает (сохранено ли, (имя, запись) для следующего сохранения).
+        """
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        safe_title = self.safe_title(title)
+        record = {
+            "title": title,
+            "questions": [dict(q) for q in questions_to_json(filled_questions)],
+            "design": design,
+            "bbcode": bbcode,
+            "bbcode_hash": bbcode_hash,  # Сохраняем хэш для проверки
+            "generated": timestamp
+        }
+        
+        storage = self.get_storage()
+        if previous is not None and previous[1]["bbcode_hash"] != bbcode_hash \
+                and storage.replace(previous[1]["bbcode_hash"], record, previous[0]):
+            name = previous[0]
+            if not self.history.exists(name):
+                self.history.start(name, previous[1], self.minify_output)
+            version = self.history.append(name, record, self.minify_output)
+            saved, info = True, [("📜 Версия", f"{version} ({self.history.path(name)})")]
+        else:
+            name = f"{safe_title}_{timestamp}"
+            info = self.find_saved_copy(storage, bbcode)
+            saved = False
+            if info is None:
+                saved, info = storage.save(record, name)
         
-        # Сохраняем BB-код
-        bbcode_file = os.path.join(self.output_folder, f"{safe_title}_{timestamp}.txt")
-        with open(bbcode_file, 'w', encoding='utf-8') as f:
-            f.write(bbcode)
-        
-        # Сохраняем данные
-        data_file = os.path.join(self.output_folder, f"{safe_title}_{timestamp}.json")
-        with open(data_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                "title": title,
-                "questions": filled_questions,
-                "design": design,
-                "bbcode": bbcode,
-                "bbcode_hash": bbcode_hash,  # Сохраняем хэш для проверки
-                "generated": timestamp
-            }, f, ensure_ascii=False, indent=2)
+        if not saved:
+            print("\n⚠️  Этот BB-код уже был сохранен ранее!")
+            print("Файл:", info)
+            print("Возвращаемся в главное меню...")
+            return False, None
         
         print(f"\n💾 РЕЗУЛЬТАТЫ СОХРАНЕНЫ:")
-        print(f"  📄 BB-код: {bbcode_file}")
-        print(f"  📊 Данные: {data_file}")
-        print(f"\n📁 Файлы сохранены в папку: {os.path.abspath(self.output_folder)}")
+        for label, location in info:
+            print(f"  {label}: {location}")
+        print(f"\n{storage.describe()}")
         
         # Копирование в буфер обмена (если доступно)
         try:
@@ -902,14 +3107,109 @@ class ImprovedFormGenerator:
         except:
             print("📋 Скопируйте BB-код выше вручную")
         
-        return True, bbcode_hash
+        return True, (name, record)
+    
+    def rebuild_version(self, name, version=None):
+        """(состояние формы, BB-код) для версии из истории или None"""
+        state = self.history.rebuild(name, version)
+        if state is None:
+            return None
+        bbcode = self.generate_bbcode(state["title"], state["questions"], state["design"])
+        if state.get("minified"):
+            bbcode = minify_bbcode(bbcode)
+        return state, bbcode
+    
+    def show_history(self, name=None, version=None):
+        """Просмотр истории версий: список форм, версии формы или BB-код версии"""
+        if not name:
+            names = self.history.names()
+            if not names:
+                print("📜 Истории версий пока нет: она появляется при повторном сохранении формы")
+            for form_name in names:
+                entries = self.history.entries(form_name)
+                print(f"📜 {form_name}: версий {len(entries)}, последняя {entries[-1]['generated']}")
+            return True
+        
+        if version is None:
+            entries = self.history.entries(name)
+            if not entries:
+                print(f"❌ Нет истории версий формы {name}")
+                return False
+            print(f"📜 {entries[0]['title']} ({name})")
+            for entry in entries:
+                if entry["version"] == 1:
+                    changes = [f"исходная форма, ответов: {len(entry['questions'])}"]
+                elif "questions" in entry:
+                    changes = ["форма заполнена заново"]
+                else:
+                    changes = [f"изменены ответы: {', '.join(entry['answers'])}"] if entry["answers"] else []
+                if "design" in entry and entry["version"] > 1:
+                    changes.append(f"стиль {entry['design']['name']}")
+                print(f"  v{entry['version']}  {entry['generated']}  {'; '.join(changes) or 'без изменений'}")
+            return True
+        
+        result = self.rebuild_version(name, version)
+        if result is None:
+            print(f"❌ Нет версии {version} формы {name}")
+            return False
+        state, bbcode = result
+        self.print_title(f"ВЕРСИЯ {version}: {state['title']}")
+        print(bbcode)
+        if hash_text(bbcode, hash_algorithm(state["bbcode_hash"])) != state["bbcode_hash"]:
+            print("\n⚠️  BB-код отличается от сохраненного в этой версии (изменился генератор?)")
+        return True
+    
+    def export_files(self, title, filled_questions, design):
+        """Запись формы в HTML (для сайта) и Markdown (для Discord) рядом с сохраненными формами"""
+        self.create_output_folder()
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        base_name = os.path.join(self.output_folder, f"{self.safe_title(title)}_{timestamp}")
+        exports = render_formats(title, filled_questions, design, ("html", "markdown"))
+        
+        print("\n🌐 ФОРМА ЭКСПОРТИРОВАНА:")
+        for name, extension, label in (("html", "html", "HTML (сайт)"), ("markdown", "md", "Markdown (Discord)")):
+            with open(f"{base_name}.{extension}", "w", encoding="utf-8") as f:
+                f.write(exports[name])
+            print(f"  {label}: {base_name}.{extension}")
+    
+    def print_bbcode(self, bbcode):
+        """Вывод BB-кода целиком или по постам, если задан лимит длины поста"""
+        posts = [bbcode]
+        if self.post_limit:
+            try:
+                posts = self.split_posts(bbcode)
+            except ValueError as e:
+                print(f"❌ {e}. BB-код показан целиком.\n")
+        
+        if len(posts) == 1:
+            print(bbcode)
+            return
+        
+        print(f"📨 Форма не помещается в один пост и разделена на {len(posts)}:")
+        for number, post in enumerate(posts, 1):
+            print(f"\n{'─' * 25} ПОСТ {number} из {len(posts)} {'─' * 25}")
+            print(post)
     
     def show_results_menu(self, title, original_questions, filled_questions, design, last_bbcode_hash=None):
-        """Меню управления после генерации BB-кода"""
+        """Меню управления после генерации BB-кода
+        
+        Возвращает "new", если пользователь выбрал заполнение новой формы.
+        """
         current_filled_questions = filled_questions.copy()
         current_design = design.copy()
-        current_bbcode = self.generate_bbcode(title, current_filled_questions, current_design)
-        current_bbcode_hash = self.get_bbcode_hash(current_bbcode)
+        bytes_saved = 0
+        saved_version = None
+        
+        def render():
+            # BB-код текущих ответов и дизайна (сжатый, если включено)
+            bbcode, bbcode_hash = self.render_form(title, current_filled_questions, current_design)
+            saved = 0
+            if self.minify_output:
+                bbcode, saved = self.minify_bbcode(bbcode)
+                bbcode_hash = self.get_bbcode_hash(bbcode)
+            return bbcode, bbcode_hash, saved
+        
+        current_bbcode, current_bbcode_hash, bytes_saved = render()
         
         # Проверяем, не пытаемся ли сохранить тот же самый BB-код
         if last_bbcode_hash == current_bbcode_hash:
@@ -920,7 +3220,9 @@ class ImprovedFormGenerator:
         while True:
             self.clear_screen()
             self.print_title("ГОТОВЫЙ BB-КОД")
-            print(current_bbcode)
+            self.print_bbcode(current_bbcode)
+            if self.minify_output:
+                print(f"\n🗜️  Лишние теги убраны: BB-код короче на {bytes_saved} байт")
             
             print("\n" + "=" * 60)
             print("МЕНЮ УПРАВЛЕНИЯ:")
@@ -930,14 +3232,18 @@ class ImprovedFormGenerator:
             print("  4. 🔄 ЗАПОЛНИТЬ ЭТУ ФОРМУ СНОВА")
             print("  5. ✏️  РЕДАКТИРОВАТЬ ЭТУ ФОРМУ")
             print("  6. 🚀 ЗАПОЛНИТЬ НОВУЮ ФОРМУ")
+            print("  7. 🌐 ЭКСПОРТ В HTML И MARKDOWN")
             print("=" * 60)
             
-            choice = input("\nВаш выбор (1-6): ").strip()
+            choice = input("\nВаш выбор (1-7): ").strip()
             
             if choice == "1":
                 # СОХРАНИТЬ РЕЗУЛЬТАТ
-                saved, new_hash = self.save_results(title, current_filled_questions, current_bbcode, current_design, current_bbcode_hash)
+                saved, version = self.save_results(title, current_filled_questions, current_bbcode, current_design,
+                                                   current_bbcode_hash, saved_version)
                 if saved:
+                    # Следующее сохранение этой формы станет ее новой версией
+                    saved_version = version
                     input("\n↵ Нажмите Enter чтобы вернуться в меню...")
                 else:
                     # Если BB-код уже был сохранен, возвращаемся в главное меню
@@ -955,8 +3261,7 @@ class ImprovedFormGenerator:
                 # ВЫБРАТЬ ДРУГОЙ СТИЛЬ
                 new_design = self.select_design()
                 current_design = new_design
-                current_bbcode = self.generate_bbcode(title, current_filled_questions, current_design)
-                current_bbcode_hash = self.get_bbcode_hash(current_bbcode)
+                current_bbcode, current_bbcode_hash, bytes_saved = render()
                 print("✅ Стиль изменен!")
                 input("\n↵ Нажмите Enter чтобы продолжить...")
             
@@ -971,8 +3276,7 @@ class ImprovedFormGenerator:
                         new_filled_questions = self.preview_form(title, new_filled_questions)
                         if new_filled_questions:
                             current_filled_questions = new_filled_questions
-                            current_bbcode = self.generate_bbcode(title, current_filled_questions, current_design)
-                            current_bbcode_hash = self.get_bbcode_hash(current_bbcode)
+                            current_bbcode, current_bbcode_hash, bytes_saved = render()
                             print("✅ Форма заполнена заново!")
                         else:
                             print("❌ Заполнение отменено!")
@@ -987,8 +3291,7 @@ class ImprovedFormGenerator:
                 edited_questions = self.edit_answers(title, current_filled_questions)
                 if edited_questions:
                     current_filled_questions = edited_questions
-                    current_bbcode = self.generate_bbcode(title, current_filled_questions, current_design)
-                    current_bbcode_hash = self.get_bbcode_hash(current_bbcode)
+                    current_bbcode, current_bbcode_hash, bytes_saved = render()
                     print("✅ Форма обновлена!")
                 else:
                     print("❌ Редактирование отменено!")
@@ -999,41 +3302,91 @@ class ImprovedFormGenerator:
                 confirm = input("Вы уверены, что хотите заполнить новую форму? (y/n): ").lower()
                 if confirm == 'y':
                     print("🚀 Начинаем новую форму...")
-                    # Рекурсивно запускаем новый процесс
-                    self.run_workflow()
-                    return
+                    # Новую форму начинает run_workflow, а не этот вызов
+                    return "new"
                 else:
                     print("✅ Отменено.")
                     input("\n↵ Нажмите Enter чтобы продолжить...")
             
+            elif choice == "7":
+                # ЭКСПОРТ В HTML И MARKDOWN
+                self.export_files(title, current_filled_questions, current_design)
+                input("\n↵ Нажмите Enter чтобы продолжить...")
+            
             else:
                 print("❌ Неверный выбор!")
                 input("\n↵ Нажмите Enter чтобы продолжить...")
     
-    def run_workflow(self):
-        """Основной рабочий процесс"""
-        # Шаг 1: Ввод формы
-        result = self.get_form_input()
-        if not result:
-            print("❌ Ошибка ввода формы!")
-            return
-        
-        title, questions = result
+    def run_workflow(self, title=None, questions=None):
+        """Основной рабочий процесс
         
-        if not questions:
-            print("❌ Не удалось извлечь вопросы из формы!")
-            return
+        Если заголовок и вопросы уже известны (шаблон из библиотеки),
+        ввод, разбор и подтверждение формы пропускаются.
         
-        print(f"\n✅ Извлечено {len(questions)} вопросов")
+        Процесс устроен как конечный автомат: каждый шаг выбирает следующий,
+        а "ввести заново" и "заполнить новую форму" возвращают к шагу ввода
+        вместо повторного вызова run_workflow. Поэтому сессия из тысяч форм
+        не растит стек и не держит данные уже законченных форм.
+        """
+        state = "input" if questions is None else "fill"
+        filled_questions = design = None
         
-        # Даем возможность удалить вопросы
+        while state != "done":
+            if state == "input":
+                # Шаг 1: Ввод формы
+                result = self.get_form_input()
+                if not result:
+                    print("❌ Ошибка ввода формы!")
+                    return
+                
+                title, questions = result
+                
+                if not questions:
+                    print("❌ Не удалось извлечь вопросы из формы!")
+                    return
+                
+                print(f"\n✅ Извлечено {len(questions)} вопросов")
+                state = "options"
+            
+            elif state == "options":
+                # Даем возможность удалить вопросы
+                state = self.form_options(title, questions)
+            
+            elif state == "fill":
+                # Шаг 2: Заполнение формы
+                filled_questions = self.fill_form(title, questions)
+                if not filled_questions:
+                    print("❌ Форма не заполнена!")
+                    return
+                
+                # Шаг 3: Предпросмотр
+                filled_questions = self.preview_form(title, filled_questions)
+                if not filled_questions:
+                    print("❌ Редактирование отменено!")
+                    return
+                
+                # Шаг 4: Выбор оформления
+                design = self.select_design()
+                state = "results"
+            
+            elif state == "results":
+                # Шаг 5: Генерация BB-кода и меню управления
+                next_step = self.show_results_menu(title, questions, filled_questions, design)
+                
+                # Форма закончена - ее данные больше не нужны
+                title = questions = filled_questions = design = None
+                state = "input" if next_step == "new" else "done"
+    
+    def form_options(self, title, questions):
+        """Опции введенной формы; возвращает следующий шаг run_workflow"""
         while True:
             print("\n🎯 ОПЦИИ ФОРМЫ:")
             print("  1. ✅ Все верно, продолжить заполнение")
             print("  2. ❌ Удалить ненужные вопросы")
             print("  3. 🔄 Ввести форму заново")
+            print("  4. 📚 Сохранить форму в библиотеку шаблонов")
             
-            choice = input("\nВаш выбор (1-3): ").strip()
+            choice = input("\nВаш выбор (1-4): ").strip()
             
             if choice == "1":
                 break
@@ -1041,32 +3394,412 @@ class ImprovedFormGenerator:
                 self.remove_questions(questions)
                 if not questions:
                     print("❌ Все вопросы удалены. Начнем заново.")
-                    return self.run_workflow()
+                    return "input"
                 break
             elif choice == "3":
-                return self.run_workflow()
+                return "input"
+            elif choice == "4":
+                self.save_template(title, questions)
             else:
                 print("❌ Неверный выбор")
         
         input("\n↵ Нажмите Enter чтобы начать заполнение...")
+        return "fill"
+    
+    def normalize_answer(self, answer, field_type):
+        """Приведение готового ответа к виду, который дает fill_form"""
+        if answer is None:
+            return ""
+        answer = str(answer)
         
-        # Шаг 2: Заполнение формы
-        filled_questions = self.fill_form(title, questions)
-        if not filled_questions:
-            print("❌ Форма не заполнена!")
-            return
+        if field_type == "multiline":
+            lines = [line.rstrip() for line in answer.split('\n') if line.strip()]
+            return "\n".join(lines)
         
-        # Шаг 3: Предпросмотр
-        filled_questions = self.preview_form(title, filled_questions)
-        if not filled_questions:
-            print("❌ Редактирование отменено!")
-            return
+        answer = answer.strip()
+        if field_type in ("link", "screenshot") and answer:
+            if not answer.startswith(("http://", "https://")):
+                answer = f"https://{answer}"
+        return answer
+    
+    def resolve_design(self, design):
+        """Получение дизайна по ключу из self.designs или из словаря цветов"""
+        if isinstance(design, dict):
+            return {
+                "name": design.get("name", "⚙️  Пользовательский дизайн"),
+                "header": design.get("header", "#CC0000"),
+                "question": design.get("question", "#FF3333"),
+                "answer": design.get("answer", "#FFFFFF"),
+                "link": design.get("link", "#0066CC")
+            }
+        return self.designs.get(str(design or "1"))
+    
+    def process_job(self, job):
+        """Обработка одного задания пакетного режима без участия пользователя
+        
+        Задание: {"form": текст формы или "template": имя шаблона,
+                  "answers": список или {номер: ответ}, "design": ключ}
+        """
+        return self.render_job(job)[0]
+    
+    def job_field_errors(self, job):
+        """Ошибки в типах полей задания (пустой список - поля в порядке)
+        
+        Проверка идет до разбора формы, чтобы задание неверной формы давало
+        ошибку в своей строке, а не обрывало весь пакет.
+        """
+        errors = []
+        for field in ("form", "template"):
+            if job.get(field) is not None and not isinstance(job[field], str):
+                errors.append(f"Поле '{field}' должно быть строкой")
+        
+        answers = job.get("answers")
+        if isinstance(answers, dict):
+            values = answers.values()
+        elif isinstance(answers, list):
+            values = answers
+        else:
+            values = ()
+            if answers is not None:
+                errors.append("Поле 'answers' должно быть списком или словарем {номер: ответ}")
+        if any(isinstance(value, (list, dict)) for value in values):
+            errors.append("Ответы в 'answers' должны быть строками или числами")
+        
+        design = job.get("design")
+        if isinstance(design, dict):
+            if not all(isinstance(value, str) for value in design.values()):
+                errors.append("Цвета в 'design' должны быть строками")
+        elif design is not None and not isinstance(design, (str, int)):
+            errors.append("Поле 'design' должно быть номером стиля или словарем цветов")
+        return errors
+    
+    def render_job(self, job):
+        """Задание пакетного режима -> (результат, заполненные вопросы, дизайн)"""
+        result = {"id": job.get("id"), "ok": False, "errors": [], "warnings": []}
+        
+        field_errors = self.job_field_errors(job)
+        if field_errors:
+            result["errors"].extend(field_errors)
+            return result, None, None
+        
+        form_text = job.get("form")
+        template = None
+        if job.get("template") is not None:
+            # Форма из библиотеки шаблонов - без разбора
+            template = self.templates.load(str(job["template"]))
+            if template is None:
+                result["errors"].append(f"Нет такого шаблона: {job['template']}")
+                return result, None, None
+        elif not isinstance(form_text, str) or not form_text.strip():
+            result["errors"].append("Не указан текст формы (поле 'form' или 'template')")
+            return result, None, None
+        
+        design = self.resolve_design(job.get("design"))
+        if design is None:
+            result["errors"].append(f"Неизвестный стиль оформления: {job.get('design')}")
+            return result, None, None
+        
+        formats = job.get("formats", self.export_formats) or ()
+        if not isinstance(formats, (list, tuple)) or not all(isinstance(name, str) for name in formats):
+            result["errors"].append(f"Поле 'formats' - список из: {', '.join(EXPORT_FORMATS)}")
+            return result, None, None
+        unknown = [name for name in formats if name not in EXPORT_FORMATS]
+        if unknown:
+            result["errors"].append(f"Неизвестный формат: {', '.join(unknown)}")
+            return result, None, None
+        
+        title, questions = template or self.parse_full_form(form_text)
+        result["title"] = title
+        if not questions:
+            result["errors"].append("Не удалось извлечь вопросы из формы")
+            return result, None, None
+        
+        answers = job.get("answers") or []
+        filled_questions = []
+        
+        for index, q in enumerate(questions):
+            # Ответы можно передать списком по порядку или словарем по номеру вопроса
+            if isinstance(answers, dict):
+                raw_answer = answers.get(str(q["number"]), answers.get(q["number"]))
+            else:
+                raw_answer = answers[index] if index < len(answers) else None
+            
+            answer = self.normalize_answer(raw_answer, q["type"])
+            if not answer:
+                result["errors"].append(f"Вопрос {q['number']}: ответ не может быть пустым")
+                continue
+            
+            is_valid, message = self.validate_input(q["clean"], answer, q["type"])
+            if not is_valid:
+                result["errors"].append(f"Вопрос {q['number']}: {message.strip('⚠️ ')}")
+                continue
+            if message != ANSWER_ACCEPTED:
+                result["warnings"].append(f"Вопрос {q['number']}: {message.strip('⚠️ ')}")
+            
+            filled_questions.append(q.with_answer(answer))
+        
+        if result["errors"]:
+            return result, None, None
+        
+        if formats:
+            # BB-код и остальные форматы за один проход по вопросам
+            exports = self.export_form(title, filled_questions, design, formats)
+            bbcode = exports.pop("bbcode")
+            result.update(exports)
+        else:
+            bbcode = self.generate_bbcode(title, filled_questions, design)
+        if self.minify_output:
+            bbcode, result["bytes_saved"] = self.minify_bbcode(bbcode)
+        result["ok"] = True
+        result["bbcode"] = bbcode
+        result["bbcode_hash"] = self.get_bbcode_hash(bbcode)
+        if self.post_limit:
+            try:
+                result["posts"] = self.split_posts(bbcode)
+            except ValueError as e:
+                result["warnings"].append(str(e))
+        return result, filled_questions, design
+    
+    def iter_batch_results(self, source, workers=0, chunk_size=64):
+        """(номер строки, результат, вопросы, дизайн) по строкам файла заданий
+        
+        Без пула результат каждого задания выдается сразу после чтения его
+        строки. С workers != 0 задания читаются блоками и раздаются пулу
+        процессов пачками по chunk_size; результаты идут в порядке строк файла.
+        """
+        import json
+        
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.use_memory_parse_cache()
+        pool = self.make_render_pool(workers) if workers else None
+        # Без пула блок - одна строка: бот, который подает задания по одному,
+        # получает ответ на каждое, не дожидаясь следующих
+        block_size = chunk_size * workers if pool is not None else 1
+        block = []
+        
+        def finish(block):
+            # Задания блока обрабатываются сразу или в пуле, ошибки JSON - как есть
+            jobs = [job for _, job, _ in block if job is not None]
+            if pool is None:
+                outputs = iter(self.render_job(job) for job in jobs)
+            else:
+                chunks = [jobs[start:start + chunk_size] for start in range(0, len(jobs), chunk_size)]
+                results = []
+                for chunk, worker_stats in pool.map(render_job_chunk, chunks):
+                    results.extend(chunk)
+                    if worker_stats is not None:
+                        self.stats.merge(worker_stats)
+                outputs = iter(results)
+            for line_number, job, error in block:
+                if job is None:
+                    yield (line_number, error, None, None)
+                else:
+                    yield (line_number,) + tuple(next(outputs))
+        
+        try:
+            for line_number, line in enumerate(source, 1):
+                if not line.strip():
+                    continue
+                try:
+                    job = json.loads(line)
+                    if not isinstance(job, dict):
+                        raise ValueError("задание должно быть JSON-объектом")
+                    block.append((line_number, job, None))
+                except ValueError as e:
+                    block.append((line_number, None, {"id": None, "ok": False,
+                                                      "errors": [f"Некорректная строка JSON: {e}"], "warnings": []}))
+                if len(block) >= block_size:
+                    yield from finish(block)
+                    block = []
+            yield from finish(block)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    
+    def run_batch(self, input_path, output_path="-", save=False, save_batch_size=500, workers=0):
+        """Пакетный режим: JSONL с заданиями → JSONL с результатами
+        
+        Файл читается и записывается построчно, поэтому расход памяти
+        не зависит от размера файла. "-" означает stdin/stdout.
+        С save=True готовые формы еще и сохраняются в хранилище пачками
+        не больше чем по save_batch_size записей, а результаты выводятся только
+        после сохранения их пачки (или с ошибкой сохранения в каждой строке);
+        в очереди на вывод не бывает больше save_batch_size строк.
+        workers - количество процессов (0 - все в текущем процессе,
+        None - по числу ядер).
+        """
+        import json
+        
+        source = sys.stdin if input_path == "-" else open(input_path, 'r', encoding='utf-8')
+        target = sys.stdout if output_path == "-" else open(output_path, 'w', encoding='utf-8')
+        storage = self.get_storage() if save else None
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        pending = []
+        waiting = []
+        
+        total = done = failed = saved = 0
+        
+        def write_results():
+            # Результаты, которые ждали сохранения своей пачки, - по порядку строк
+            nonlocal done, failed
+            for result in waiting:
+                if result["ok"]:
+                    done += 1
+                else:
+                    failed += 1
+                output_line = json.dumps(result, ensure_ascii=False) + "\n"
+                target.write(output_line)
+                
+                if self.stats.enabled:
+                    self.stats.count("batch.jobs")
+                    self.stats.count("batch.bytes_written", len(output_line.encode('utf-8')))
+            target.flush()
+            waiting.clear()
+        
+        def save_pending():
+            nonlocal saved
+            try:
+                # Формы, сохраненные раньше с другим --hash, - такие же дубликаты
+                algorithms = storage.hash_algorithms()
+                if algorithms - {self.hash_algorithm}:
+                    pending[:] = [(record, name) for record, name in pending
+                                  if self.find_saved_copy(storage, record["bbcode"], algorithms) is None]
+                saved += storage.save_many(pending)
+            except Exception as e:
+                # Пачка не сохранилась целиком - так и сообщаем в каждой ее строке
+                for result in waiting:
+                    if result["ok"]:
+                        result["ok"] = False
+                        result["errors"].append(f"Не удалось сохранить форму: {e}")
+            pending.clear()
+        
+        try:
+            for line_number, result, filled_questions, design in self.iter_batch_results(source, workers):
+                total += 1
+                result["line"] = line_number
+                waiting.append(result)
+                
+                if storage is not None and result["ok"]:
+                    pending.append(({
+                        "title": result["title"],
+                        "questions": questions_to_json(filled_questions),
+                        "design": design,
+                        "bbcode": result["bbcode"],
+                        "bbcode_hash": result["bbcode_hash"],
+                        "generated": timestamp
+                    }, f"{self.safe_title(result['title'])}_{timestamp}_{line_number}"))
+                
+                # Пачка сохраняется, когда в ней save_batch_size форм или когда
+                # столько строк ждет вывода (много заданий с ошибками после одной
+                # успешной) - так очередь не растет без предела
+                if pending and len(waiting) >= save_batch_size:
+                    save_pending()
+                if not pending:
+                    write_results()
+            
+            if pending:
+                save_pending()
+            write_results()
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if target is not sys.stdout:
+                target.close()
+        
+        print(f"✅ Обработано заданий: {total} (успешно: {done}, с ошибками: {failed})", file=sys.stderr)
+        if storage is not None:
+            print(f"💾 Сохранено новых форм: {saved}. {storage.describe()}", file=sys.stderr)
+        return failed == 0
+    
+    def retheme_saved(self, design_key, workers=None, batch_size=256):
+        """Перерисовка всех сохраненных форм в дизайне self.designs[design_key]
+        
+        Записи читаются из хранилища потоком и отрисовываются пачками в пуле
+        процессов. Записи, у которых bbcode_hash уже совпадает с новым BB-кодом,
+        не перезаписываются. Обработанные записи отмечаются в файле прогресса,
+        поэтому прерванную перерисовку можно запустить снова с того же места.
+        Возвращает (всего записей, перерисовано, уже в этом стиле); записи,
+        чей новый BB-код уже сохранен в другой записи, остаются как были
+        и не входят ни в одно из двух чисел. Сжатые (--minify) записи
+        остаются сжатыми, несжатые - несжатыми.
+        """
+        design = self.designs[design_key]
+        storage = self.get_storage()
+        checkpoint = os.path.join(self.output_folder, f"retheme_{self.storage_backend}_{design_key}.log")
+        
+        done = set()
+        if os.path.exists(checkpoint):
+            with open(checkpoint, 'r', encoding='utf-8') as f:
+                done = {line.rstrip("\n") for line in f}
+        
+        if workers is None:
+            workers = os.cpu_count() or 1
+        pool = self.make_render_pool(workers) if workers else None
+        total = updated = current = 0
+        
+        def was_minified(record, bbcode):
+            # Флага сжатия в записях нет. Если сжатие нового BB-кода ничего не
+            # меняет (стандартные дизайны), выбирать не из чего; иначе запись
+            # сравнивается с несжатой отрисовкой в ее прежнем дизайне
+            if minify_bbcode(bbcode) == bbcode:
+                return False
+            old_bbcode = RenderPlan.for_design(record["design"]).render(record["title"], record["questions"])
+            if old_bbcode == minify_bbcode(old_bbcode):
+                return self.minify_output
+            return record["bbcode"] != old_bbcode and record["bbcode"] == minify_bbcode(old_bbcode)
+        
+        def finish(block):
+            # Отрисовка пачки, запись изменившихся форм и отметка в файле прогресса
+            forms = [(record["title"], record["questions"], design) for _, record in block]
+            if pool is None:
+                bbcodes = render_chunk(forms)
+            else:
+                chunks = [forms[start:start + 64] for start in range(0, len(forms), 64)]
+                bbcodes = [bbcode for chunk in pool.map(render_chunk, chunks) for bbcode in chunk]
+            
+            updates = []
+            for (record_id, record), bbcode in zip(block, bbcodes):
+                if was_minified(record, bbcode):
+                    bbcode = minify_bbcode(bbcode)
+                old_hash = record.get("bbcode_hash") or ""
+                # Сравнение тем же алгоритмом, которым посчитан сохраненный хэш
+                if hash_text(bbcode, hash_algorithm(old_hash)) != old_hash:
+                    updates.append((record_id, record.get("bbcode_hash"),
+                                    dict(record, design=design, bbcode=bbcode,
+                                         bbcode_hash=self.get_bbcode_hash(bbcode))))
+            changed = storage.update_many(updates) if updates else 0
+            
+            log.write("".join(f"{record_id}\n" for record_id, _ in block))
+            log.flush()
+            return changed, len(block) - len(updates)
         
-        # Шаг 4: Выбор оформления
-        design = self.select_design()
+        self.create_output_folder()
+        try:
+            with open(checkpoint, 'a', encoding='utf-8') as log:
+                block = []
+                for record_id, record in storage.iter_records():
+                    total += 1
+                    if str(record_id) in done:
+                        current += 1
+                        continue
+                    block.append((record_id, record))
+                    if len(block) >= batch_size:
+                        changed, same = finish(block)
+                        updated += changed
+                        current += same
+                        block = []
+                if block:
+                    changed, same = finish(block)
+                    updated += changed
+                    current += same
+        finally:
+            if pool is not None:
+                pool.shutdown()
         
-        # Шаг 5: Генерация BB-кода и меню управления
-        self.show_results_menu(title, questions, filled_questions, design)
+        # Все записи обработаны - прогресс больше не нужен
+        os.remove(checkpoint)
+        return total, updated, current
     
     def show_example(self):
         """Показать пример формы"""
@@ -1076,26 +3809,44 @@ class ImprovedFormGenerator:
         print("📋 Вот как должна выглядеть форма для вставки:")
         print()
         print("=" * 60)
-        print("Форма подачи:")
-        print()
-        print("1. Ваш игровой Никнейм:")
-        print("2. Ваш игровой уровень:")
-        print("3. Скриншот статистики аккаунта(/time):")
-        print("4. Были ли баны/варны(если да, то за что):")
-        print("5. Как вы считаете, почему именно вы должны занять пост старшего состава:")
-        print("6. Были ли ранее на руководящей должности:")
-        print("7. Ссылка на одобренную РП биографию (обязательна для занятия должности заместителя организации):")
-        print("8. Ваш часовой пояс:")
-        print("9. Ссылка на страницу ВК:")
-        print("10. Логин Discord:")
-        print("11. Ваше реальное имя:")
-        print("12. Ваш реальный возраст:")
+        print(EXAMPLE_FORM)
         print("=" * 60)
         print()
         print("💡 Просто скопируйте ЭТОТ ТЕКСТ целиком и вставьте в программу!")
         
         input("\n↵ Нажмите Enter чтобы вернуться...")
     
+    def save_template(self, title, questions):
+        """Сохранение введенной формы в библиотеку шаблонов"""
+        name = input(f"Название шаблона [{title}]: ").strip() or title
+        text = "\n".join([title, ""] + [q["original"] for q in questions])
+        count = self.templates.add(name, text)
+        if count:
+            print(f"✅ Шаблон «{name}» сохранен ({count} вопросов)")
+        else:
+            print("❌ Не удалось сохранить шаблон")
+    
+    def choose_template(self):
+        """Выбор шаблона из библиотеки и заполнение формы по нему"""
+        self.clear_screen()
+        self.print_title("БИБЛИОТЕКА ШАБЛОНОВ")
+        
+        names = self.templates.names()
+        for number, name in enumerate(names, 1):
+            print(f"  [{number}] {name}")
+        print("\n  [0] ↩️  Назад")
+        
+        while True:
+            choice = input(f"\nНомер шаблона (0-{len(names)}): ").strip()
+            if choice == "0":
+                return
+            if choice.isdigit() and 1 <= int(choice) <= len(names):
+                break
+            print("❌ Неверный выбор")
+        
+        title, questions = self.templates.load(names[int(choice) - 1])
+        self.run_workflow(title, questions)
+    
     def show_designs(self):
         """Показать доступные стили"""
         self.clear_screen()
@@ -1121,6 +3872,8 @@ class ImprovedFormGenerator:
             self.clear_screen()
             self.print_title("ГЕНЕРАТОР ФОРМ ДЛЯ BLACKRUSSIA")
             print(f"📦 Версия: {self.current_version}")
+            if self.available_update:
+                print(f"🎉 Доступна новая версия {self.available_update}! Подробнее — пункт 5 меню")
             
             print("🚀 ПРОСТОЙ ПОРЯДОК:")
             print("  1. Вставить готовую форму (копируешь из темы на форуме)")
@@ -1131,27 +3884,31 @@ class ImprovedFormGenerator:
             print("\n" + "═" * 40)
             print("ГЛАВНОЕ МЕНЮ:")
             print("  1. 🚀 НАЧАТЬ СОЗДАНИЕ ФОРМЫ")
-            print("  2. 📖 ПОКАЗАТЬ ПРИМЕР ФОРМЫ")
-            print("  3. 🎨 ПОСМОТРЕТЬ СТИЛИ")
-            print("  4. 🔄 ПРОВЕРИТЬ ОБНОВЛЕНИЯ")
-            print("  5. 🚪 ВЫХОД")
+            print("  2. 📚 ВЫБРАТЬ ШАБЛОН ИЗ БИБЛИОТЕКИ")
+            print("  3. 📖 ПОКАЗАТЬ ПРИМЕР ФОРМЫ")
+            print("  4. 🎨 ПОСМОТРЕТЬ СТИЛИ")
+            print("  5. 🔄 ПРОВЕРИТЬ ОБНОВЛЕНИЯ")
+            print("  6. 🚪 ВЫХОД")
             
-            choice = input("\nВаш выбор (1-5): ").strip()
+            choice = input("\nВаш выбор (1-6): ").strip()
             
             if choice == "1":
                 self.run_workflow()
             
             elif choice == "2":
-                self.show_example()
+                self.choose_template()
             
             elif choice == "3":
-                self.show_designs()
+                self.show_example()
             
             elif choice == "4":
+                self.show_designs()
+            
+            elif choice == "5":
                 self.check_for_updates(silent=False)
                 input("\n↵ Нажмите Enter чтобы продолжить...")
             
-            elif choice == "5":
+            elif choice == "6":
                 print("\n👋 До свидания!")
                 break
             
@@ -1159,10 +3916,459 @@ class ImprovedFormGenerator:
                 print("❌ Неверный выбор!")
                 input("\n↵ Нажмите Enter чтобы продолжить...")
 
-def main():
+# Генератор процесса из пула отрисовки (создается в init_render_worker)
+_worker_generator = None
+
+
+def init_render_worker(output_folder, designs, settings=None, stats=False):
+    """Подготовка процесса пула: свой генератор и планы отрисовки дизайнов"""
+    global _worker_generator
+    _worker_generator = ImprovedFormGenerator()
+    _worker_generator.output_folder = output_folder
+    for name, value in (settings or {}).items():
+        setattr(_worker_generator, name, value)
+    if stats:
+        _worker_generator.enable_stats()
+    _worker_generator.use_memory_parse_cache()
+    for design in designs:
+        RenderPlan.for_design(design)
+
+
+def render_chunk(forms):
+    """Отрисовка пачки форм (заголовок, вопросы, дизайн) в процессе пула"""
+    return [RenderPlan.for_design(design).render(title, filled_questions)
+            for title, filled_questions, design in forms]
+
+
+def take_worker_stats():
+    """Замеры процесса пула с прошлого вызова (None, если --stats выключен)"""
+    if not _worker_generator.stats.enabled:
+        return None
+    return _worker_generator.stats.take()
+
+
+def render_job_chunk(jobs):
+    """Обработка пачки заданий пакетного режима в процессе пула
+    
+    Возвращает результаты заданий и замеры процесса за эту пачку.
+    """
+    return [_worker_generator.render_job(job) for job in jobs], take_worker_stats()
+
+
+def parse_form_text(form_text):
+    """Заголовок, вопросы (в JSON) и замеры разбора текста формы в процессе пула"""
+    title, questions = _worker_generator.parse_full_form(form_text)
+    return title, questions_to_json(questions), take_worker_stats()
+
+
+def render_bbcode(title, filled_questions, design, algorithm=DEFAULT_HASH):
+    """BB-код формы и его хэш (вызывается в том числе в процессах пула)"""
+    bbcode = RenderPlan.for_design(design).render(title, filled_questions)
+    return bbcode, hash_text(bbcode, algorithm)
+
+
+def render_exports(title, filled_questions, design, formats, algorithm=DEFAULT_HASH):
+    """BB-код, его хэш и словарь других форматов (формат -> текст)"""
+    if not formats:
+        return render_bbcode(title, filled_questions, design, algorithm) + ({},)
+    exports = render_formats(title, filled_questions, design, ("bbcode", *formats))
+    bbcode = exports.pop("bbcode")
+    return bbcode, hash_text(bbcode, algorithm), exports
+
+
+class FormService:
+    """Локальный HTTP-сервис для бота и веб-панели (JSON в обе стороны)
+    
+    POST /parse     {"form": текст}                             -> {"title", "questions"}
+    POST /validate  {"question", "answer", "type" (необяз.)}    -> {"ok", "message", "type"}
+    POST /render    {"title", "questions": [...], "design",
+                     "minify", "post_limit", "formats" (необяз.)} -> {"bbcode", "bbcode_hash",
+                                                                    "bytes_saved", "posts",
+                                                                    "html", "markdown"}
+    
+    Соединения остаются открытыми (keep-alive), одновременно выполняется
+    не больше max_concurrent запросов, а разбор и отрисовка уходят в пул
+    процессов.
+    """
+    
+    MAX_BODY = 4 * 1024 * 1024
+    IDLE_TIMEOUT = 30
+    REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+    
+    def __init__(self, generator, max_concurrent=64, workers=None):
+        self.generator = generator
+        self.generator.use_memory_parse_cache()
+        self.max_concurrent = max_concurrent
+        # None - по числу ядер, 0 - отрисовка без пула, прямо в сервисе
+        self.workers = workers
+        self.routes = {"/parse": self.parse, "/validate": self.validate, "/render": self.render}
+        self.limit = None
+        self.pool = None
+    
+    def run(self, host="127.0.0.1", port=8080):
+        import asyncio
+        import signal
+        
+        # По SIGTERM сервис завершается как по Ctrl+C, с остановкой пула процессов
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        asyncio.run(self.serve(host, port))
+    
+    async def serve(self, host, port):
+        import asyncio
+        
+        self.limit = asyncio.Semaphore(self.max_concurrent)
+        if self.workers != 0:
+            self.pool = self.generator.make_render_pool(self.workers)
+            # Процессы пула запускаются до приема соединений: процесс, созданный
+            # fork позже, унаследовал бы сокеты клиентов, и они не закрывались бы
+            await asyncio.get_running_loop().run_in_executor(self.pool, os.getpid)
+        try:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            async with server:
+                print(f"🌐 Сервис запущен: http://{host}:{port} "
+                      f"(запросов одновременно: {self.max_concurrent})", file=sys.stderr)
+                await server.serve_forever()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+    
+    async def handle_connection(self, reader, writer):
+        """Обработка запросов одного соединения, пока клиент его не закроет"""
+        import asyncio
+        
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        asyncio.TimeoutError, ConnectionError):
+                    break
+                
+                request_line, *header_lines = head.decode('latin-1').split("\r\n")
+                headers = {}
+                for line in header_lines:
+                    name, separator, value = line.partition(":")
+                    if separator:
+                        headers[name.strip().lower()] = value.strip()
+                
+                try:
+                    method, path, version = request_line.split(" ", 2)
+                    length = int(headers.get("content-length") or 0)
+                    if length < 0:
+                        raise ValueError("отрицательный Content-Length")
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "Некорректный HTTP-запрос"}, False)
+                    break
+                if length > self.MAX_BODY:
+                    await self.respond(writer, 413, {"error": "Слишком большой запрос"}, False)
+                    break
+                
+                # HTTP/1.1 держит соединение по умолчанию, HTTP/1.0 - только по просьбе
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                
+                try:
+                    body = await reader.readexactly(length) if length else b""
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                
+                async with self.limit:
+                    status, payload = await self.dispatch(method, path, body)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    async def respond(self, writer, status, payload, keep_alive):
+        import json
+        
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {self.REASONS[status]}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+    
+    async def dispatch(self, method, path, body):
+        """(код ответа, JSON ответа) для запроса"""
+        import json
+        
+        handler = self.routes.get(path.split("?", 1)[0])
+        if handler is None:
+            return 404, {"error": f"Неизвестный адрес: {path}"}
+        if method != "POST":
+            return 405, {"error": "Поддерживается только POST"}
+        
+        try:
+            payload = json.loads(body or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("ожидается JSON-объект")
+        except ValueError as e:
+            return 400, {"error": f"Некорректный JSON: {e}"}
+        
+        try:
+            return 200, await handler(payload)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": f"Внутренняя ошибка: {e}"}
+    
+    async def parse(self, payload):
+        import asyncio
+        
+        form_text = payload.get("form")
+        if not isinstance(form_text, str) or not form_text.strip():
+            raise ValueError("Не указан текст формы (поле 'form')")
+        if self.pool is None:
+            title, questions = self.generator.parse_full_form(form_text)
+            return {"title": title, "questions": questions_to_json(questions)}
+        
+        loop = asyncio.get_running_loop()
+        title, questions, worker_stats = await loop.run_in_executor(self.pool, parse_form_text, form_text)
+        if worker_stats is not None:
+            self.generator.stats.merge(worker_stats)
+        return {"title": title, "questions": questions}
+    
+    async def validate(self, payload):
+        question, answer = payload.get("question"), payload.get("answer")
+        if not isinstance(question, str) or not isinstance(answer, str):
+            raise ValueError("Нужны строковые поля 'question' и 'answer'")
+        field_type = payload.get("type") or self.generator.detect_field_type(question)
+        is_valid, message = self.generator.validate_input(question, answer, field_type)
+        return {"ok": is_valid, "message": message, "type": field_type}
+    
+    async def render(self, payload):
+        import asyncio
+        
+        title = payload.get("title", "")
+        if not isinstance(title, str):
+            raise ValueError("Поле 'title' должно быть строкой")
+        design = self.generator.resolve_design(payload.get("design"))
+        if design is None:
+            raise ValueError(f"Неизвестный стиль оформления: {payload.get('design')}")
+        
+        filled_questions = []
+        for number, q in enumerate(payload.get("questions") or [], 1):
+            if not isinstance(q, dict) or not isinstance(q.get("question"), str):
+                raise ValueError(f"Вопрос {number}: нужно строковое поле 'question'")
+            filled_questions.append({
+                "number": q.get("number", number),
+                "question": q["question"],
+                "answer": str(q.get("answer") or ""),
+                "type": q.get("type") or self.generator.detect_field_type(q["question"])
+            })
+        
+        formats = payload.get("formats", list(self.generator.export_formats)) or []
+        if not isinstance(formats, list) or not all(isinstance(name, str) and name in EXPORT_FORMATS
+                                                    for name in formats):
+            raise ValueError(f"Поле 'formats' - список из: {', '.join(EXPORT_FORMATS)}")
+        
+        algorithm = self.generator.hash_algorithm
+        if self.pool is None:
+            bbcode, bbcode_hash, response = render_exports(title, filled_questions, design, formats, algorithm)
+        else:
+            loop = asyncio.get_running_loop()
+            bbcode, bbcode_hash, response = await loop.run_in_executor(
+                self.pool, render_exports, title, filled_questions, design, formats, algorithm)
+        if payload.get("minify", self.generator.minify_output):
+            bbcode, response["bytes_saved"] = self.generator.minify_bbcode(bbcode)
+            bbcode_hash = self.generator.get_bbcode_hash(bbcode)
+        response["bbcode"] = bbcode
+        response["bbcode_hash"] = bbcode_hash
+        
+        post_limit = payload.get("post_limit", self.generator.post_limit)
+        if post_limit:
+            if not isinstance(post_limit, int) or post_limit <= 0:
+                raise ValueError("Поле 'post_limit' должно быть положительным числом")
+            measure = utf8_length if payload.get("post_limit_bytes", self.generator.post_limit_bytes) else len
+            response["posts"] = split_bbcode(bbcode, post_limit, measure)
+        return response
+
+
+def main(argv=None):
     """Запуск программы"""
+    argv = sys.argv[1:] if argv is None else argv
+    
+    # Обычный запуск без параметров не тратит время на разбор командной строки
+    if argv:
+        return run_command(argv)
+    
     try:
         generator = ImprovedFormGenerator()
+        generator.check_for_updates_on_start()
+        generator.main_menu()
+    except KeyboardInterrupt:
+        print("\n\n👋 Программа прервана")
+    except Exception as e:
+        print(f"\n❌ Ошибка: {e}")
+        input("\n↵ Нажмите Enter для выхода...")
+
+def run_command(argv):
+    """Запуск с параметрами командной строки"""
+    import argparse
+    import json
+    
+    # Создание генератора не трогает ни диск, ни сеть - стили нужны уже для параметров
+    generator = ImprovedFormGenerator()
+    
+    parser = argparse.ArgumentParser(description="Генератор BB-код форм для BlackRussia")
+    parser.add_argument("--batch", metavar="JOBS.jsonl",
+                        help="пакетный режим: файл заданий JSONL ('-' — stdin)")
+    parser.add_argument("--output", metavar="RESULTS.jsonl", default="-",
+                        help="куда писать результаты пакетного режима ('-' — stdout)")
+    parser.add_argument("--rebuild-index", action="store_true",
+                        help="перестроить индекс хэшей по папке с сохраненными формами")
+    parser.add_argument("--parse", metavar="FORM.txt",
+                        help="разобрать форму из файла ('-' — stdin) и вывести вопросы в JSONL")
+    parser.add_argument("--no-update-check", action="store_true",
+                        help="не проверять обновления при запуске меню")
+    parser.add_argument("--storage", choices=["folder", "sqlite", "archive"], default="folder",
+                        help="где хранить сохраненные формы: файлы в папке, база SQLite или сжатый архив")
+    parser.add_argument("--save", action="store_true",
+                        help="в пакетном режиме сохранять готовые формы в хранилище")
+    parser.add_argument("--save-batch", type=int, default=500, metavar="N",
+                        help="с --save сохранять формы пачками по N (результаты пачки выводятся после ее сохранения)")
+    parser.add_argument("--migrate-sqlite", metavar="FOLDER", nargs="?", const="",
+                        help="перенести формы из папки (по умолчанию form_blackrussia) в базу SQLite")
+    parser.add_argument("--migrate-archive", metavar="FOLDER", nargs="?", const="",
+                        help="перенести формы из папки (по умолчанию form_blackrussia) в сжатый архив")
+    parser.add_argument("--minify", action="store_true",
+                        help="убирать лишние теги из BB-кода (короче пост, тот же вид на форуме)")
+    parser.add_argument("--export", nargs="+", choices=[name for name in EXPORT_FORMATS if name != "bbcode"],
+                        default=[], metavar="FORMAT",
+                        help="в пакетном режиме также выводить форму в HTML и/или Markdown (html, markdown)")
+    parser.add_argument("--hash", choices=sorted(HASH_ALGORITHMS), default=DEFAULT_HASH,
+                        help="алгоритм хэша для поиска повторов (формы с хэшами других алгоритмов тоже находятся)")
+    parser.add_argument("--post-limit", type=int, metavar="N",
+                        help="делить BB-код на посты не длиннее N символов (лимит форума)")
+    parser.add_argument("--post-limit-bytes", action="store_true",
+                        help="лимит --post-limit считается в байтах UTF-8, а не в символах")
+    parser.add_argument("--history", nargs="?", const="", metavar="ИМЯ",
+                        help="история версий: список форм, версии формы ИМЯ (имя файла без .json)")
+    parser.add_argument("--history-version", type=int, metavar="N",
+                        help="вместе с --history ИМЯ - вывести BB-код версии N")
+    parser.add_argument("--list-templates", action="store_true",
+                        help="показать шаблоны из библиотеки")
+    parser.add_argument("--add-template", nargs=2, metavar=("NAME", "FORM.txt"),
+                        help="разобрать форму из файла и сохранить в библиотеку шаблонов под именем NAME")
+    parser.add_argument("--retheme", metavar="DESIGN", choices=list(generator.designs),
+                        help=f"перерисовать все сохраненные формы в стиле с этим номером "
+                             f"({', '.join(generator.designs)})")
+    parser.add_argument("--serve", metavar="HOST:PORT", nargs="?", const="127.0.0.1:8080",
+                        help="запустить локальный HTTP-сервис (по умолчанию 127.0.0.1:8080)")
+    parser.add_argument("--max-concurrent", type=int, default=64,
+                        help="сколько запросов сервис выполняет одновременно")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="количество процессов для отрисовки (сервис: по умолчанию по числу ядер; "
+                             "пакетный режим: по умолчанию без пула; 0 — без пула)")
+    parser.add_argument("--stats", metavar="STATS.json",
+                        help="замерить время и счетчики этапов и записать их в JSON ('-' — stderr)")
+    args = parser.parse_args(argv)
+    
+    generator.storage_backend = args.storage
+    generator.minify_output = args.minify
+    generator.export_formats = tuple(args.export)
+    generator.hash_algorithm = args.hash
+    generator.post_limit = args.post_limit
+    generator.post_limit_bytes = args.post_limit_bytes
+    if args.stats:
+        generator.enable_stats()
+    
+    try:
+        run_generator_command(generator, args)
+    finally:
+        if args.stats:
+            generator.stats.write(args.stats)
+
+def run_generator_command(generator, args):
+    """Выполнение выбранной в командной строке команды"""
+    import json
+    
+    if args.parse:
+        source = sys.stdin if args.parse == "-" else open(args.parse, 'r', encoding='utf-8')
+        try:
+            form = generator.iter_form_stream(source)
+            for question in form:
+                sys.stdout.write(json.dumps(question.to_dict(), ensure_ascii=False) + "\n")
+            sys.stdout.write(json.dumps({"title": form.title, "questions": form.count}, ensure_ascii=False) + "\n")
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        return
+    
+    if args.rebuild_index:
+        count = generator.hash_index.rebuild()
+        print(f"✅ Индекс перестроен: {count} форм в папке {os.path.abspath(generator.output_folder)}")
+        return
+    
+    if args.migrate_sqlite is not None or args.migrate_archive is not None:
+        if args.migrate_sqlite is not None:
+            folder = args.migrate_sqlite or generator.output_folder
+            generator.storage_backend = "sqlite"
+        else:
+            folder = args.migrate_archive or generator.output_folder
+            generator.storage_backend = "archive"
+        storage = generator.get_storage()
+        found, saved = storage.import_folder(folder)
+        print(f"✅ Найдено форм: {found}, перенесено новых: {saved}")
+        print(storage.describe())
+        return
+    
+    if args.add_template:
+        name, path = args.add_template
+        with open(path, 'r', encoding='utf-8') as f:
+            count = generator.templates.add(name, f.read())
+        if not count:
+            print(f"❌ Не удалось извлечь вопросы из {path}")
+            sys.exit(1)
+        print(f"✅ Шаблон «{name}» сохранен ({count} вопросов)")
+        return
+    
+    if args.list_templates:
+        for name in generator.templates.names():
+            title, questions = generator.templates.load(name)
+            print(f"📚 {name}: {title} ({len(questions)} вопросов)")
+        return
+    
+    if args.history is not None:
+        if not generator.show_history(args.history, args.history_version):
+            sys.exit(1)
+        return
+    
+    if args.retheme:
+        design = generator.designs[args.retheme]
+        print(f"🎨 Перерисовка сохраненных форм в стиль {design['name']}...")
+        total, updated, current = generator.retheme_saved(args.retheme, workers=args.workers)
+        print(f"✅ Всего форм: {total}, перерисовано: {updated}, уже в этом стиле: {current}")
+        if total - updated - current:
+            print(f"⚠️  Не перерисовано (такой BB-код уже сохранен в другой записи): "
+                  f"{total - updated - current}")
+        print(generator.get_storage().describe())
+        return
+    
+    if args.serve:
+        host, _, port = args.serve.rpartition(":")
+        service = FormService(generator, max_concurrent=args.max_concurrent, workers=args.workers)
+        try:
+            service.run(host or "127.0.0.1", int(port))
+        except KeyboardInterrupt:
+            print("\n👋 Сервис остановлен", file=sys.stderr)
+        return
+    
+    if args.batch:
+        ok = generator.run_batch(args.batch, args.output, save=args.save, save_batch_size=args.save_batch,
+                                 workers=args.workers or 0)
+        sys.exit(0 if ok else 1)
+    
+    try:
+        if not args.no_update_check:
+            generator.check_for_updates_on_start()
         generator.main_menu()
     except KeyboardInterrupt:
         print("\n\n👋 Программа прервана")
@@ -1171,4 +4377,4 @@ def main():
         input("\n↵ Нажмите Enter для выхода...")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()